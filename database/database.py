@@ -1,9 +1,71 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from bisect import bisect_right
+from sqlalchemy.dialects import mysql, sqlite
 
 db = SQLAlchemy()
 
-class Customer(db.Model):
+def upsert(model, values, updates):
+    """
+    Inserts a row, or applies ``updates`` to the row with the same primary key.
+
+    One INSERT ... ON DUPLICATE KEY UPDATE on MySQL and INSERT ... ON CONFLICT DO
+    UPDATE elsewhere, so concurrent writers of a new key neither race between an UPDATE
+    and an INSERT nor fail on the primary key. MySQL evaluates the assignments in order,
+    each seeing the columns already assigned, while other databases see the old row:
+    an expression reading a column must come before that column's own assignment. The
+    row joins the caller's transaction.
+
+    Args:
+        model (Model): The model whose table receives the row.
+        values (dict): Column values of a new row.
+        updates (list): (column name, value or expression) pairs applied to an existing row.
+    """
+    if db.session.get_bind().dialect.name == 'mysql':
+        stmt = mysql.insert(model).values(**values).on_duplicate_key_update(updates)
+    else:
+        stmt = sqlite.insert(model).values(**values).on_conflict_do_update(
+            index_elements=[key.name for key in model.__table__.primary_key], set_=dict(updates))
+    db.session.execute(stmt)
+
+def insert_ignore(model, rows):
+    """
+    Inserts rows, skipping those whose primary key already exists.
+
+    A no-op ON DUPLICATE KEY UPDATE on MySQL and ON CONFLICT DO NOTHING elsewhere, so
+    concurrent writers of the same key neither fail nor need a prior read. The rows join
+    the caller's transaction.
+
+    Args:
+        model (Model): The model whose table receives the rows.
+        rows (list): One dict of column values per row.
+    """
+    if db.session.get_bind().dialect.name == 'mysql':
+        stmt = mysql.insert(model)
+        stmt = stmt.on_duplicate_key_update({key.name: stmt.inserted[key.name] for key in model.__table__.primary_key})
+    else:
+        stmt = sqlite.insert(model).on_conflict_do_nothing()
+    db.session.execute(stmt, rows)
+
+class Versioned:
+    """
+    Row version and modification time, the validators of conditional GETs.
+
+    Every UPDATE of the row, from the ORM or a Core ``db.update``, increments ``version``
+    and sets ``updated_at`` through the columns' ``onupdate`` values; upserts, which
+    skip those, set them explicitly. Read routes derive strong ETags from the versions
+    and Last-Modified from ``updated_at`` (see services/conditional.py). Existing tables
+    need the columns added by hand, since ``db.create_all`` does not alter tables:
+
+        ALTER TABLE <table> ADD COLUMN version INTEGER NOT NULL DEFAULT 1,
+            ADD COLUMN updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP;
+    """
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                        onupdate=db.text('version + 1'))
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                           server_default=db.func.current_timestamp(), onupdate=datetime.utcnow)
+
+class Customer(Versioned, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     full_name = db.Column(db.String(100), nullable=False)
     username = db.Column(db.String(50), unique=True, nullable=False)
@@ -16,7 +78,7 @@ class Customer(db.Model):
     sales = db.relationship('Sale', backref='customer', lazy=True)
     reviews = db.relationship('Review', backref='customer', lazy=True)
 
-class InventoryItem(db.Model):
+class InventoryItem(Versioned, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
     category = db.Column(db.String(50), nullable=False)
@@ -35,11 +97,331 @@ class Sale(db.Model):
     total_price = db.Column(db.Float, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
-class Review(db.Model):
+class Review(Versioned, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
     item_id = db.Column(db.Integer, db.ForeignKey('inventory_item.id'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)
     comment = db.Column(db.Text, nullable=True)
     status = db.Column(db.String(20), default='pending')  # 'approved', 'pending', 'flagged', 'deleted'
+    sentiment = db.Column(db.Float, nullable=True, index=True)  # Lexicon score of the comment, -1 to 1
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime, nullable=True)  # Set on soft deletion, purged later by purge_deleted_reviews
+
+    # Deleted reviews stay in place until purged. Status sits right after item_id in the
+    # listing index, so deleted rows form their own index range and never enter scans of
+    # the live 'approved' and 'pending' sets; the purge job walks (status, deleted_at).
+    __table_args__ = (
+        db.Index('ix_review_item_status_timestamp', 'item_id', 'status', 'timestamp'),
+        db.Index('ix_review_item_status_rating', 'item_id', 'status', 'rating', 'id'),  # Keyset paging by rating
+        db.Index('ix_review_status_deleted_at', 'status', 'deleted_at'),
+        db.Index('ix_review_status_id', 'status', 'id'),  # Keyset paging of the moderation queue
+        db.Index('ix_review_customer_timestamp', 'customer_id', 'timestamp'),
+        db.Index('uq_review_customer_item', 'customer_id', 'item_id', unique=True),  # One review per customer and item
+    )
+
+class CustomerStat(db.Model):
+    """
+    Precomputed customer demographic counters, one row per (dimension, bucket).
+
+    Maintained incrementally by ``apply_customer_stats`` so that ``/customers/stats``
+    never has to scan the ``customer`` table.
+    """
+    dimension = db.Column(db.String(20), primary_key=True)  # 'total', 'age', 'gender', 'marital_status', 'wallet'
+    bucket = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    wallet_total = db.Column(db.Float, nullable=False, default=0.0)
+
+AGE_EDGES = [18, 25, 35, 45, 55, 65]
+AGE_LABELS = ['<18', '18-24', '25-34', '35-44', '45-54', '55-64', '65+']
+WALLET_EDGES = [0, 50, 100, 500, 1000]
+WALLET_LABELS = ['<0', '0-50', '50-100', '100-500', '500-1000', '1000+']
+
+def age_bucket(age):
+    """
+    Maps an age to its demographic bucket label.
+
+    Args:
+        age (int): The customer's age, or None.
+
+    Returns:
+        str: The bucket label.
+    """
+    if age is None or age < 0:
+        return 'Unknown'
+    return AGE_LABELS[bisect_right(AGE_EDGES, age)]
+
+def wallet_bucket(wallet):
+    """
+    Maps a wallet balance to its distribution bucket label.
+
+    Args:
+        wallet (float): The wallet balance.
+
+    Returns:
+        str: The bucket label.
+    """
+    return WALLET_LABELS[bisect_right(WALLET_EDGES, wallet or 0.0)]
+
+def category_bucket(value):
+    """
+    Normalizes a free-form category such as gender or marital status.
+
+    Args:
+        value (str): The stored value, possibly empty or None.
+
+    Returns:
+        str: The capitalized value, or 'Unknown'.
+    """
+    return (value or '').capitalize() or 'Unknown'
+
+def snapshot_customer_stats(customer):
+    """
+    Captures the counter buckets a customer currently contributes to.
+
+    Args:
+        customer (Customer): The customer to snapshot.
+
+    Returns:
+        dict: A mapping of dimension to (bucket, wallet) pairs. Wallet sums are only
+        tracked for the 'total' and 'wallet' dimensions.
+    """
+    wallet = customer.wallet or 0.0
+    return {
+        'total': ('all', wallet),
+        'age': (age_bucket(customer.age), 0.0),
+        'gender': (category_bucket(customer.gender), 0.0),
+        'marital_status': (category_bucket(customer.marital_status), 0.0),
+        'wallet': (wallet_bucket(wallet), wallet),
+    }
+
+def _bump_customer_stat(dimension, bucket, count, wallet):
+    # One upsert, so two registrations opening the same new bucket cannot collide on its key
+    upsert(CustomerStat, dict(dimension=dimension, bucket=bucket, count=count, wallet_total=wallet),
+           [('count', CustomerStat.count + count), ('wallet_total', CustomerStat.wallet_total + wallet)])
+
+def apply_customer_stats(before, after):
+    """
+    Moves a customer's contribution between counter buckets.
+
+    Only dimensions whose bucket or wallet changed are touched, so a wallet charge
+    issues a couple of single-row updates instead of a full recount. The changes
+    join the caller's transaction and are committed with it.
+
+    Args:
+        before (dict): Snapshot taken before the change, or None for a new customer.
+        after (dict): Snapshot taken after the change, or None for a deleted customer.
+    """
+    for dimension in (before or after):
+        old = before[dimension] if before else None
+        new = after[dimension] if after else None
+        if old == new:
+            continue
+        if old and new and old[0] == new[0]:
+            _bump_customer_stat(dimension, old[0], 0, new[1] - old[1])
+            continue
+        if old:
+            _bump_customer_stat(dimension, old[0], -1, -old[1])
+        if new:
+            _bump_customer_stat(dimension, new[0], 1, new[1])
+
+# Bayesian average: ratings are shrunk towards BAYES_PRIOR_MEAN as if every item had
+# BAYES_PRIOR_WEIGHT extra reviews at that rating, so one 5-star review can't top a chart.
+BAYES_PRIOR_MEAN = 3.0
+BAYES_PRIOR_WEIGHT = 10
+
+def bayesian_average(rating_sum, count):
+    """
+    Computes the Bayesian-average rating used to rank items.
+
+    Args:
+        rating_sum (int): Sum of the approved ratings.
+        count (int): Number of approved ratings.
+
+    Returns:
+        float: The smoothed rating.
+    """
+    return (BAYES_PRIOR_WEIGHT * BAYES_PRIOR_MEAN + rating_sum) / (BAYES_PRIOR_WEIGHT + count)
+
+class ItemRating(db.Model):
+    """
+    Running rating summary for an item over its approved reviews.
+
+    Maintained incrementally by ``apply_item_rating`` whenever a review enters or
+    leaves the 'approved' status, so summaries are served without touching ``review``.
+    The item's category and Bayesian-average score are kept alongside and indexed, so
+    category leaderboards are read straight off an index.
+
+    Rows only ever receive deltas, so the table must be filled from the existing
+    reviews once when it is first deployed, before the services take traffic::
+
+        docker compose exec reviews flask reviews rebuild-ratings
+
+    Until then an item without a row gets one holding only the approvals made since.
+    """
+    item_id = db.Column(db.Integer, db.ForeignKey('inventory_item.id'), primary_key=True)
+    category = db.Column(db.String(50), nullable=False)  # Capitalized InventoryItem.category
+    bayesian_score = db.Column(db.Float, nullable=False, default=BAYES_PRIOR_MEAN)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_1 = db.Column(db.Integer, nullable=False, default=0)
+    rating_2 = db.Column(db.Integer, nullable=False, default=0)
+    rating_3 = db.Column(db.Integer, nullable=False, default=0)
+    rating_4 = db.Column(db.Integer, nullable=False, default=0)
+    rating_5 = db.Column(db.Integer, nullable=False, default=0)
+    last_approved = db.Column(db.DateTime, nullable=True)  # Time of the most recent approval
+    sentiment_sum = db.Column(db.Float, nullable=False, default=0.0)
+    sentiment_count = db.Column(db.Integer, nullable=False, default=0)  # Approved reviews with a sentiment score
+
+    __table_args__ = (
+        db.Index('ix_item_rating_category_score', 'category', 'bayesian_score'),
+        db.Index('ix_item_rating_category_count', 'category', 'count'),
+        db.Index('ix_item_rating_score', 'bayesian_score'),
+        db.Index('ix_item_rating_count', 'count'),
+    )
+
+    def average(self):
+        """
+        Returns:
+            float: The mean approved rating, or None when there are no approved reviews.
+        """
+        return round(self.rating_sum / self.count, 2) if self.count else None
+
+    def histogram(self):
+        """
+        Returns:
+            dict: Approved review counts keyed by rating "1" to "5".
+        """
+        return {str(r): getattr(self, f'rating_{r}') for r in range(1, 6)}
+
+    def sentiment_average(self):
+        """
+        Returns:
+            float: The mean comment sentiment of approved reviews, or None if none are scored.
+        """
+        return round(self.sentiment_sum / self.sentiment_count, 3) if self.sentiment_count else None
+
+def snapshot_item_rating(review):
+    """
+    Captures what a review contributes to its item's rating summary.
+
+    Args:
+        review (Review): The review to snapshot.
+
+    Returns:
+        tuple: (item_id, rating, sentiment) when the review is approved, otherwise None.
+    """
+    if review.status != 'approved':
+        return None
+    return (review.item_id, review.rating, review.sentiment)
+
+def _bump_item_rating(item_id, histogram, sentiment, approved_at=None):
+    count = sum(histogram.values())
+    rating_sum = sum(rating * n for rating, n in histogram.items())
+    deltas = {'count': count, 'rating_sum': rating_sum, 'sentiment_sum': sentiment[0], 'sentiment_count': sentiment[1]}
+    deltas.update((f'rating_{r}', histogram.get(r, 0)) for r in range(1, 6))
+    # The score comes first: MySQL would evaluate it against the already-updated columns
+    # if it followed their assignments, other databases always use the old ones
+    updates = [('bayesian_score', (BAYES_PRIOR_WEIGHT * BAYES_PRIOR_MEAN + ItemRating.rating_sum + rating_sum)
+                / (BAYES_PRIOR_WEIGHT + ItemRating.count + count))]
+    updates += [(name, getattr(ItemRating, name) + delta) for name, delta in deltas.items() if delta]
+    if approved_at:
+        updates.append(('last_approved', approved_at))
+
+    if count <= 0 or min(histogram.values()) < 0 or sentiment[1] < 0:
+        # Removals only update: an item's first row comes from an approval, and a missing
+        # row is filled by rebuild-ratings rather than inserted with negative counts
+        db.session.execute(
+            db.update(ItemRating).where(ItemRating.item_id == item_id).ordered_values(*updates)
+            .execution_options(synchronize_session=False)
+        )
+        return
+    item = db.session.get(InventoryItem, item_id)
+    if item is None:
+        return  # Deleted while the review was moderated
+    upsert(ItemRating, dict(deltas, item_id=item_id, category=item.category.capitalize(), last_approved=approved_at,
+                            bayesian_score=bayesian_average(rating_sum, count)), updates)
+
+def apply_item_rating_batch(removed, added, approval=True):
+    """
+    Applies many review contributions to item rating summaries at once.
+
+    Contributions are folded into one histogram and sentiment delta per item, so a
+    batch touching thousands of reviews issues one UPDATE (or upsert, for approvals)
+    per affected item. The
+    changes join the caller's transaction and are committed with it.
+
+    Args:
+        removed (iterable): Snapshots of reviews leaving the 'approved' status.
+        added (iterable): Snapshots of reviews entering the 'approved' status.
+        approval (bool): Whether added snapshots are new approvals that should bump
+            ``last_approved``; False when only re-scoring approved reviews.
+    """
+    deltas = {}
+    approved_items = set()
+    for snapshots, sign in ((removed, -1), (added, 1)):
+        for item_id, rating, sentiment in filter(None, snapshots):
+            histogram, totals = deltas.setdefault(item_id, ({}, [0.0, 0]))
+            histogram[rating] = histogram.get(rating, 0) + sign
+            if sentiment is not None:
+                totals[0] += sign * sentiment
+                totals[1] += sign
+            if sign > 0 and approval:
+                approved_items.add(item_id)
+    now = datetime.utcnow()
+    for item_id, (histogram, totals) in deltas.items():
+        histogram = {rating: n for rating, n in histogram.items() if n}
+        if histogram or totals[1] or totals[0] or item_id in approved_items:
+            _bump_item_rating(item_id, histogram, totals, now if item_id in approved_items else None)
+
+def apply_item_rating(before, after):
+    """
+    Moves a review's contribution between item rating summaries.
+
+    The changes join the caller's transaction and are committed with it.
+
+    Args:
+        before (tuple): Snapshot taken before the status change, or None.
+        after (tuple): Snapshot taken after the status change, or None.
+    """
+    if before != after:
+        apply_item_rating_batch([before], [after])
+
+class ReviewScreeningQueue(db.Model):
+    """
+    Reviews waiting for the screening worker.
+
+    Submissions and edits queue the review in the same transaction that sets it
+    pending, so an edited or resubmitted review is screened again although it keeps
+    its ID. ``screen_pending_reviews`` takes rows off the queue in batches.
+    """
+    review_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+class ReviewIndexQueue(db.Model):
+    """
+    Reviews whose comments are still to be added to the search index.
+
+    Requests only queue a review here; ``index_queued_reviews`` (run by the screening
+    worker) indexes the queue in batches, so submissions never wait on the row locks of
+    the index's blocks.
+    """
+    review_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+class ReviewPosting(db.Model):
+    """
+    One block of the inverted index over ``Review.comment``.
+
+    Each term's posting list is split into blocks of sorted review IDs, stored
+    delta-encoded as varints. New reviews only rewrite the term's last block.
+    Postings are never removed on edit or delete; searches re-check candidates
+    against the live review, and ``rebuild_search_index`` compacts the index.
+    """
+    term = db.Column(db.String(64), primary_key=True)
+    block = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    max_id = db.Column(db.Integer, nullable=False)  # Largest review ID in the block
+    postings = db.Column(db.LargeBinary, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_review_posting_term_max_id', 'term', 'max_id'),
+    )
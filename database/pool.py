@@ -0,0 +1,223 @@
+"""
+Connection pool configuration and metrics shared by all services.
+
+Engine options are read from the environment so pool sizing can be tuned per
+deployment in ``docker-compose.yml`` without touching the code:
+
+    DB_POOL_SIZE: Connections kept open per process (default 10).
+    DB_MAX_OVERFLOW: Extra connections allowed under burst load (default 20).
+    DB_POOL_TIMEOUT: Seconds to wait for a free connection before failing (default 30).
+    DB_POOL_RECYCLE: Seconds after which a connection is replaced, kept below MySQL's
+        wait_timeout (default 1800).
+    DB_POOL_PRE_PING: Test connections on checkout so a MySQL restart does not surface
+        as errors on stale connections (default true).
+    SQLALCHEMY_ENGINE_OPTIONS: Optional JSON object merged over the options above.
+
+Every pool records how long requests waited for a connection, and pooled
+connections are dropped in forked children so a pre-forking server never shares a
+MySQL socket between processes.
+
+The ASGI read path (services/asgi.py) uses an asyncio engine on the same database,
+through the aiomysql driver, with the same pool options.
+"""
+import json
+import os
+import threading
+import time
+import weakref
+from flask import current_app
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from database.database import db
+
+_engines = weakref.WeakSet()
+ASYNC_DRIVERS = {'mysql': 'mysql+aiomysql', 'mysql+pymysql': 'mysql+aiomysql', 'sqlite': 'sqlite+aiosqlite'}
+
+
+class MeteredQueuePool(QueuePool):
+    """
+    QueuePool that counts checkouts and measures how long each one waited.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._metrics_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._metrics_lock:
+                self.checkouts += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; carry the counters over so they stay monotonic
+        pool = super().recreate()
+        pool.checkouts, pool.timeouts = self.checkouts, self.timeouts
+        pool.wait_seconds_total, pool.wait_seconds_max = self.wait_seconds_total, self.wait_seconds_max
+        return pool
+
+
+class MeteredAsyncQueuePool(MeteredQueuePool, AsyncAdaptedQueuePool):
+    """
+    MeteredQueuePool for asyncio engines.
+    """
+
+
+def _env_flag(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def engine_options_from_env(uri):
+    """
+    Builds SQLALCHEMY_ENGINE_OPTIONS from the environment.
+
+    Args:
+        uri (str): The database URI the options are for. SQLite engines keep their
+            default pool, which does not take sizing options.
+
+    Returns:
+        dict: Keyword arguments for ``create_engine``.
+    """
+    if uri.startswith('sqlite'):
+        options = {}
+    else:
+        options = {
+            'poolclass': MeteredQueuePool,
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+            'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+            'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+            'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', True),
+        }
+    if os.environ.get('SQLALCHEMY_ENGINE_OPTIONS'):
+        options.update(json.loads(os.environ['SQLALCHEMY_ENGINE_OPTIONS']))
+    return options
+
+
+def async_database_uri(uri):
+    """
+    Maps a database URI to the same database through its asyncio driver.
+
+    Args:
+        uri (str): A URI such as ``mysql+pymysql://...``.
+
+    Returns:
+        str: The URI with an asyncio driver, such as ``mysql+aiomysql://...``.
+
+    Raises:
+        ValueError: If there is no asyncio driver for the URI's dialect.
+    """
+    scheme, separator, rest = uri.partition('://')
+    if scheme not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver for '{scheme}'")
+    return ASYNC_DRIVERS[scheme] + separator + rest
+
+
+def create_async_database_engine(app):
+    """
+    Creates an asyncio engine for an app's database.
+
+    Pool options come from SQLALCHEMY_ASYNC_ENGINE_OPTIONS in the app config, or from
+    the environment like the synchronous engine's. The engine is recorded on the app
+    so :func:`pool_status` reports its pool too.
+
+    Args:
+        app (Flask): An app set up by :func:`configure_database`.
+
+    Returns:
+        AsyncEngine: The engine; dispose of it when the event loop shuts down.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    uri = async_database_uri(app.config['SQLALCHEMY_DATABASE_URI'])
+    options = app.config.get('SQLALCHEMY_ASYNC_ENGINE_OPTIONS')
+    if options is None:
+        options = engine_options_from_env(uri)
+        if options.get('poolclass') is MeteredQueuePool:
+            options['poolclass'] = MeteredAsyncQueuePool
+    engine = create_async_engine(uri, **options)
+    app.extensions['async_engine'] = engine
+    return engine
+
+
+def configure_database(app, default_uri):
+    """
+    Points an app at its database and initializes the shared SQLAlchemy instance.
+
+    The URI is the app's own SQLALCHEMY_DATABASE_URI when its configuration sets one,
+    so an app built for a test keeps its database; otherwise it comes from
+    SQLALCHEMY_DATABASE_URI in the environment, falling back to ``default_uri``. The
+    engine options come from :func:`engine_options_from_env`.
+
+    Args:
+        app (Flask): The application to configure.
+        default_uri (str): The URI to use when neither the configuration nor the
+            environment sets one.
+    """
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or os.environ.get('SQLALCHEMY_DATABASE_URI', default_uri)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options_from_env(uri))
+    db.init_app(app)
+    with app.app_context():
+        _engines.update(db.engines.values())
+
+
+def pool_status():
+    """
+    Reports the state of the current app's connection pools.
+
+    Returns:
+        dict: Per-bind pool size, connections in use, idle and overflow connections,
+            and checkout wait statistics where the pool records them.
+    """
+    engines = dict(db.engines)
+    if current_app.extensions.get('async_engine') is not None:
+        engines['async'] = current_app.extensions['async_engine'].sync_engine
+    status = {}
+    for bind, engine in engines.items():
+        pool = engine.pool
+        entry = {'class': type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            entry.update({
+                'size': pool.size(),
+                'in_use': pool.checkedout(),
+                'idle': pool.checkedin(),
+                'overflow': max(pool.overflow(), 0),
+            })
+        if isinstance(pool, MeteredQueuePool):
+            entry.update({
+                'checkouts': pool.checkouts,
+                'timeouts': pool.timeouts,
+                'wait_seconds_total': round(pool.wait_seconds_total, 6),
+                'wait_seconds_max': round(pool.wait_seconds_max, 6),
+            })
+        status[bind or 'default'] = entry
+    return status
+
+
+def _dispose_after_fork():
+    # The child inherits the parent's open sockets; forget them without closing so the
+    # parent's connections stay usable, and let the child open its own on first use.
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_after_fork)
@@ -0,0 +1,70 @@
+"""
+Gunicorn settings shared by every service and the combined app.
+
+Production entry points (the Werkzeug server started by ``__main__`` is for
+development only)::
+
+    gunicorn -c gunicorn.conf.py app:app                                      # combined app
+    gunicorn -c gunicorn.conf.py "services:create_app(services=['reviews'])"  # one service
+
+Gunicorn pre-forks GUNICORN_WORKERS processes, each serving GUNICORN_THREADS requests
+at a time. ``kill -HUP <master pid>`` reloads the code gracefully: new workers start,
+importing the current code, and old ones finish their in-flight requests first. The
+master never imports the app, so the reload works with Gunicorn as a container's
+PID 1 (a USR2 binary upgrade would replace the master and stop the container).
+
+Configuration (environment):
+    PORT: Port to listen on (default 5000).
+    GUNICORN_WORKERS: Worker processes (default 2 * CPUs + 1).
+    GUNICORN_THREADS: Threads per worker (default 4).
+    GUNICORN_WORKER_CLASS: 'gthread' (default) for the Flask apps, or
+        'uvicorn.workers.UvicornWorker' for the ASGI apps in services/asgi.py.
+    GUNICORN_WORKER_CONNECTIONS: Open client connections per worker, including idle
+        keep-alive ones (default 1000).
+    GUNICORN_KEEPALIVE: Seconds an idle keep-alive connection is held open (default 5).
+    GUNICORN_TIMEOUT: Seconds before a silent worker is killed and replaced (default 30).
+    GUNICORN_GRACEFUL_TIMEOUT: Seconds workers get to finish requests on reload or
+        shutdown (default 30).
+    GUNICORN_ACCESSLOG: Access log file, '-' for stdout (default) or empty to disable.
+    GUNICORN_MAX_REQUESTS: Requests after which a worker is recycled, to bound memory
+        growth; 0 disables (default 2000).
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+# No preload_app: each worker imports the app itself, and the master never imports it
+# (see when_ready), so the new workers started by HUP load the current code.
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-') or None
+errorlog = '-'
+
+
+CREATE_TABLES = """
+import sys
+from gunicorn.util import import_app
+from database.database import db
+
+app = import_app(sys.argv[1])
+app = getattr(getattr(app, 'state', None), 'flask_app', app)  # ASGI apps wrap a Flask app
+with app.app_context():
+    db.create_all()
+"""
+
+
+def when_ready(server):
+    # Same table creation the development entry points do before serving, in a child
+    # process so that the master does not import the app
+    subprocess.run([sys.executable, '-c', CREATE_TABLES, server.app.app_uri], check=True)
+
@@ -0,0 +1,160 @@
+# benchmark_async.py
+#
+# Compares the synchronous Flask read path (Gunicorn gthread workers) with the ASGI read
+# path (services/asgi.py under Uvicorn workers) on /sales/display_goods, with up to 1,000
+# concurrent keep-alive connections. Run from the repository root:
+#
+#     python -m profiling.benchmark_async [seconds_per_level] [db_latency_ms] [workers]
+#
+# Both servers read a throwaway SQLite database. To stand in for the network round trip
+# to MySQL, every statement sleeps db_latency_ms (default 5) on the thread that executes
+# it: a Flask worker thread on the sync path, the driver's own thread on the async path,
+# so only the sync path blocks a request thread while it waits.
+
+import asyncio
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from flask import Flask
+from database.database import db, InventoryItem
+
+DB_PATH = "/tmp/benchmark_async.db"
+REQUEST = b"GET /sales/display_goods HTTP/1.1\r\nHost: localhost\r\n\r\n"
+CONCURRENCY = [100, 1000]
+SERVERS = [
+    ("sync, 4 threads/worker", "gthread", 4, "sync_app()"),
+    ("sync, 32 threads/worker", "gthread", 32, "sync_app()"),
+    ("async", "uvicorn.workers.UvicornWorker", 1, "async_app()"),
+]
+
+def latency():
+    return float(os.environ.get("BENCH_DB_LATENCY_MS", 5)) / 1000
+
+def connect_sync():
+    connection = sqlite3.connect(DB_PATH, check_same_thread=False)
+    delay = latency()
+    connection.set_trace_callback(lambda statement: time.sleep(delay))
+    return connection
+
+async def connect_async():
+    import aiosqlite
+    connection = await aiosqlite.connect(DB_PATH)
+    delay = latency()
+    await connection.set_trace_callback(lambda statement: time.sleep(delay))
+    return connection
+
+def sync_app():
+    from services import create_app
+    return create_app(['sales'], config={
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{DB_PATH}",
+        'SQLALCHEMY_ENGINE_OPTIONS': {'creator': connect_sync, 'pool_size': 32, 'max_overflow': 0},
+        'RATELIMIT_ENABLED': False,
+    })
+
+def async_app():
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+    from services.asgi import create_asgi_app
+    return create_asgi_app(['sales'], config={
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{DB_PATH}",
+        'SQLALCHEMY_ASYNC_ENGINE_OPTIONS': {'async_creator': connect_async, 'poolclass': AsyncAdaptedQueuePool,
+                                            'pool_size': 100, 'max_overflow': 0},
+        'RATELIMIT_ENABLED': False,
+    })
+
+def seed():
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{DB_PATH}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(InventoryItem(name=f"Item {i}", category="Electronics", price=10.0 + i, stock=5)
+                           for i in range(50))
+        db.session.commit()
+
+def start(port, worker_class, threads, factory, workers, db_latency_ms):
+    env = dict(os.environ, GUNICORN_WORKERS=str(workers), GUNICORN_THREADS=str(threads),
+               GUNICORN_WORKER_CLASS=worker_class, GUNICORN_WORKER_CONNECTIONS="4000", GUNICORN_ACCESSLOG="",
+               GUNICORN_MAX_REQUESTS="0", BENCH_DB_LATENCY_MS=str(db_latency_ms))
+    env.pop("SQLALCHEMY_DATABASE_URI", None)
+    cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-b", f"127.0.0.1:{port}",
+           f"profiling.benchmark_async:{factory}"]
+    process = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            if asyncio.run(fetch_once(port)) == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"server on port {port} did not start")
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    await reader.readexactly(length)
+    return status
+
+async def fetch_once(port):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(REQUEST)
+    status = await read_response(reader)
+    writer.close()
+    return status
+
+async def client(port, deadline, latencies, errors):
+    connection = None
+    while time.perf_counter() < deadline:
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection("127.0.0.1", port)
+            reader, writer = connection
+            start = time.perf_counter()
+            writer.write(REQUEST)
+            status = await asyncio.wait_for(read_response(reader), timeout=max(deadline - start, 0.1) + 5)
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(status)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            errors.append(type(e).__name__)
+            if connection:
+                connection[1].close()
+            connection = None
+            await asyncio.sleep(0.05)
+    if connection:
+        connection[1].close()
+
+async def measure(port, concurrency, seconds):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(client(port, deadline, latencies, errors) for _ in range(concurrency)))
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float("nan")
+    return len(latencies) / seconds, p99, len(errors)
+
+def run(seconds, db_latency_ms, workers):
+    seed()
+    print(f"{'server':<26}{'clients':>8}{'req/s':>10}{'p99 (ms)':>10}{'errors':>8}")
+    for port, (label, worker_class, threads, factory) in enumerate(SERVERS, start=5200):
+        process = start(port, worker_class, threads, factory, workers, db_latency_ms)
+        try:
+            for concurrency in CONCURRENCY:
+                throughput, p99, errors = asyncio.run(measure(port, concurrency, seconds))
+                print(f"{label:<26}{concurrency:>8}{throughput:>10.0f}{p99:>10.0f}{errors:>8}")
+        finally:
+            process.terminate()
+            process.wait()
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    db_latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+    run(seconds, db_latency_ms, workers)
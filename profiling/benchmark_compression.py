@@ -0,0 +1,44 @@
+# benchmark_compression.py
+#
+# Measures what compressing listing responses saves and costs: bytes sent and CPU
+# time per response for each coding services/compression.py can use here, on
+# get_items-like payloads of several sizes, and the cost of a cache hit. Run from the
+# repository root:
+#
+#     python -m profiling.benchmark_compression
+
+import hashlib
+import statistics
+import timeit
+from flask import Flask
+from services.compression import available_encodings
+from services.serialization import to_json
+
+ROWS = [100, 1000, 10000]
+REPEATS = 7
+
+def listing(rows):
+    return to_json([{"name": f"Item {i}", "category": ("Electronics", "Accessories", "Books")[i % 3],
+                     "price": round(10.0 + i * 1.37, 2), "description": f"Description of item {i}",
+                     "stock": i % 50} for i in range(rows)])
+
+def compress(factory, body):
+    compressor = factory()
+    return compressor.compress(body) + compressor.flush()
+
+def run():
+    encodings = available_encodings(Flask(__name__).config)
+    print(f"{'rows':>6}{'coding':>8}{'bytes':>10}{'sent':>9}{'saved':>8}{'median (ms)':>13}")
+    for rows in ROWS:
+        body = listing(rows)
+        for name, factory in encodings.items():
+            sent = len(compress(factory, body))
+            samples = [timeit.timeit(lambda: compress(factory, body), number=5) / 5 * 1000 for _ in range(REPEATS)]
+            print(f"{rows:>6}{name:>8}{len(body):>10}{sent:>9}{1 - sent / len(body):>8.1%}"
+                  f"{statistics.median(samples):>13.3f}")
+        samples = [timeit.timeit(lambda: hashlib.blake2b(body, digest_size=16).digest(), number=5) / 5 * 1000
+                   for _ in range(REPEATS)]
+        print(f"{rows:>6}{'cached':>8}{len(body):>10}{'':>9}{'':>8}{statistics.median(samples):>13.3f}")
+
+if __name__ == "__main__":
+    run()
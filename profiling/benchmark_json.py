@@ -0,0 +1,77 @@
+# benchmark_json.py
+#
+# Measures what encoding a 10,000-row JSON response costs, from rows to response
+# body, with Flask's standard library encoder and strftime'd timestamps (how every
+# route worked before services/serialization.py), and with FastJSONProvider with and
+# without orjson. Run from the repository root:
+#
+#     python -m profiling.benchmark_json [rows]
+
+import statistics
+import sys
+import timeit
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import Flask
+from services import serialization
+from services.serialization import FastJSONProvider
+
+Item = namedtuple("Item", "name category price description stock")
+Review = namedtuple("Review", "username rating comment timestamp")
+REPEATS = 7
+
+def payloads(rows):
+    start = datetime(2024, 1, 1)
+    items = [Item(f"Item {i}", "Electronics", 10.0 + i, f"Description of item {i}", i % 50) for i in range(rows)]
+    reviews = [Review(f"user{i}", i % 5 + 1, f"Comment number {i}, with some words in it.",
+                      start + timedelta(seconds=37 * i, microseconds=i)) for i in range(rows)]
+    return items, reviews
+
+def serialize_items(items):
+    return [{"name": item.name, "category": item.category, "price": item.price, "description": item.description,
+             "stock": item.stock} for item in items]
+
+def serialize_reviews(reviews, timestamp):
+    return [{"username": review.username, "rating": review.rating, "comment": review.comment,
+             "timestamp": timestamp(review.timestamp)} for review in reviews]
+
+def encoders():
+    stdlib = Flask("stdlib")
+    fast = Flask("fast")
+    fast.json = FastJSONProvider(fast)
+    return [
+        ("stdlib, strftime", stdlib, lambda value: value.strftime('%Y-%m-%d %H:%M:%S'), None),
+        ("provider, no orjson", fast, lambda value: value, "fallback"),
+        ("provider, orjson", fast, lambda value: value, "orjson"),
+    ]
+
+def encode(app, rows):
+    with app.app_context():
+        return app.json.response(rows).get_data()
+
+def run(rows):
+    items, reviews = payloads(rows)
+    orjson = serialization.orjson
+    checks = {}
+    for label, app, timestamp, mode in encoders():
+        checks[(label, "items")] = (mode, lambda app=app: encode(app, serialize_items(items)))
+        checks[(label, "reviews")] = (mode, lambda app=app, timestamp=timestamp:
+                                      encode(app, serialize_reviews(reviews, timestamp)))
+    samples = {key: [] for key in checks}
+    # Rounds alternate between the encoders so they all see the same machine noise
+    for _ in range(REPEATS):
+        for key, (mode, check) in checks.items():
+            if mode == "orjson" and orjson is None:
+                continue
+            serialization.orjson = None if mode == "fallback" else orjson
+            samples[key].append(timeit.timeit(check, number=3) / 3 * 1000)
+    serialization.orjson = orjson
+
+    print(f"{rows} rows per response")
+    print(f"{'encoder':<22}{'payload':<10}{'min (ms)':>10}{'median (ms)':>13}")
+    for (label, payload), values in samples.items():
+        if values:
+            print(f"{label:<22}{payload:<10}{min(values):>10.2f}{statistics.median(values):>13.2f}")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,82 @@
+# benchmark_ratelimit.py
+#
+# Measures what a rate limit check costs with each storage, and whether the limit holds
+# when several forked workers (like Gunicorn's) check the same client. Run from the
+# repository root:
+#
+#     python -m profiling.benchmark_ratelimit [workers]
+#
+# "memory, fixed window" is what every service used before services/ratelimit.py.
+
+import os
+import statistics
+import sys
+import tempfile
+import timeit
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter, SlidingWindowCounterRateLimiter
+from services.ratelimit import TokenBucketRateLimiter  # also registers mmap://
+
+CLIENTS = [f"10.0.{i // 256}.{i % 256}" for i in range(1000)]
+LIMIT = parse("1000000 per minute")
+REPEATS = 15
+
+def storages(path):
+    memory = storage_from_string("memory://")
+    shared = storage_from_string(f"mmap://{path}")
+    return [
+        ("memory, fixed window", FixedWindowRateLimiter(memory)),
+        ("memory, sliding window", SlidingWindowCounterRateLimiter(memory)),
+        ("mmap, fixed window", FixedWindowRateLimiter(shared)),
+        ("mmap, sliding window", SlidingWindowCounterRateLimiter(shared)),
+        ("mmap, token bucket", TokenBucketRateLimiter(shared)),
+    ]
+
+def per_check(limiters):
+    # Rounds alternate between the storages so they all see the same machine noise
+    checks = {}
+    for label, limiter in limiters:
+        checks[label] = lambda limiter=limiter: [limiter.hit(LIMIT, "sales.display_available_goods", client)
+                                                 for client in CLIENTS]
+        checks[label]()
+    samples = {label: [] for label in checks}
+    for _ in range(REPEATS):
+        for label, check in checks.items():
+            samples[label].append(timeit.timeit(check, number=20) / (20 * len(CLIENTS)) * 1e6)
+    return samples
+
+def allowed_across_workers(limiter, workers, limit):
+    read_fd, write_fd = os.pipe()
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            allowed = sum(limiter.hit(limit, "sales.display_available_goods", "10.0.0.1")
+                          for _ in range(2 * limit.amount))
+            os.write(write_fd, allowed.to_bytes(4, "little"))
+            os._exit(0)
+        children.append(pid)
+    for pid in children:
+        os.waitpid(pid, 0)
+    counts = os.read(read_fd, 4 * workers)
+    os.close(read_fd)
+    os.close(write_fd)
+    return sum(int.from_bytes(counts[i:i + 4], "little") for i in range(0, len(counts), 4))
+
+def run(workers):
+    with tempfile.TemporaryDirectory() as directory:
+        limiters = storages(os.path.join(directory, "ratelimit"))
+        print(f"{'storage':<24}{'min (us)':>10}{'median (us)':>13}")
+        for label, samples in per_check(limiters).items():
+            print(f"{label:<24}{min(samples):>10.2f}{statistics.median(samples):>13.2f}")
+
+        limit = parse("1000 per day")
+        print(f"\n{workers} workers, limit {limit}")
+        print(f"{'storage':<24}{'allowed':>10}")
+        for label, limiter in limiters:
+            limiter.storage.reset()
+            print(f"{label:<24}{allowed_across_workers(limiter, workers, limit):>10}")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 4)
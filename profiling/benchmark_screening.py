@@ -0,0 +1,47 @@
+# benchmark_screening.py
+#
+# Measures how many review comments the automated screener scores per second on a
+# single core. Run from the repository root:
+#
+#     python -m profiling.benchmark_screening
+
+import random
+import time
+from services.reviews.screening import ReviewScreener, DEFAULT_BLOCKLIST
+
+WORDS = ("great good bad terrible laptop mouse battery screen fast slow delivery price quality "
+         "works broke returned recommend love hate cheap sturdy light heavy").split()
+
+def make_comments(count, seed=0):
+    """
+    Generates a mix of clean, shouting, spammy and repetitive comments.
+    """
+    rng = random.Random(seed)
+    comments = []
+    for i in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(5, 60))]
+        kind = i % 10
+        if kind == 0:
+            words.insert(rng.randrange(len(words)), rng.choice(DEFAULT_BLOCKLIST))
+        elif kind == 1:
+            words.append("http://deals.example/" + str(i))
+        elif kind == 2:
+            words = [w.upper() for w in words]
+        comments.append(" ".join(words))
+    return comments
+
+def run(count=100000, blocklist_size=len(DEFAULT_BLOCKLIST)):
+    blocklist = list(DEFAULT_BLOCKLIST) + [f"spamterm{i}" for i in range(blocklist_size - len(DEFAULT_BLOCKLIST))]
+    screener = ReviewScreener(blocklist)
+    comments = make_comments(count)
+    start = time.perf_counter()
+    outcomes = {'approved': 0, 'flagged': 0, None: 0}
+    for comment in comments:
+        outcomes[screener.classify(comment)] += 1
+    elapsed = time.perf_counter() - start
+    print(f"blocklist={len(blocklist):>5}  reviews={count}  {count / elapsed:,.0f} reviews/s/core  "
+          f"(approved={outcomes['approved']}, flagged={outcomes['flagged']}, held={outcomes[None]})")
+
+if __name__ == "__main__":
+    for size in (10, 1000, 10000):
+        run(blocklist_size=size)
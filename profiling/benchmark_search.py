@@ -0,0 +1,88 @@
+# benchmark_search.py
+#
+# Compares /reviews/search's inverted index with a LIKE scan over review comments.
+# Seeds a throwaway SQLite database, builds the index, then times both strategies for
+# rare, common and multi-word queries. Run from the repository root:
+#
+#     python -m profiling.benchmark_search [reviews] [database_path]
+#
+# The default of 5,000,000 reviews takes several minutes to seed and index.
+
+import os
+import random
+import sys
+import time
+from flask import Flask
+from sqlalchemy import text
+from database.database import db, Customer, InventoryItem, Review
+from services.reviews.search import search_reviews, rebuild_search_index
+
+VOCABULARY = [f"word{i}" for i in range(20000)]
+DEFECTS = ["cracked", "overheats", "rattles", "peeling", "flickers"]
+
+def seed(count, rng):
+    db.session.add(Customer(id=1, full_name="Bench Mark", username="bench", password="x"))
+    db.session.add(InventoryItem(id=1, name="Widget", category="Electronics", price=1.0, stock=1))
+    db.session.commit()
+    statuses = ['approved', 'approved', 'approved', 'pending', 'flagged']
+    for start in range(0, count, 50000):
+        rows = []
+        for review_id in range(start + 1, min(start + 50000, count) + 1):
+            # Zipf-like word frequencies; one review in 10,000 mentions a defect
+            words = [VOCABULARY[min(int(rng.paretovariate(1.1)) - 1, 19999)] for _ in range(rng.randint(5, 40))]
+            if review_id % 10000 == 0:
+                words.insert(rng.randrange(len(words)), rng.choice(DEFECTS))
+            rows.append({"id": review_id, "rating": rng.randint(1, 5), "comment": " ".join(words),
+                         "status": rng.choice(statuses)})
+        db.session.execute(text(
+            "INSERT INTO review (id, customer_id, item_id, rating, comment, status, timestamp) "
+            "VALUES (:id, :id, 1, :rating, :comment, :status, CURRENT_TIMESTAMP)"), rows)
+        db.session.commit()
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def like_scan(terms, status=None, limit=50):
+    stmt = db.select(Review.id).where(Review.status != 'deleted')
+    for term in terms:
+        stmt = stmt.where(Review.comment.like(f"%{term}%"))
+    if status:
+        stmt = stmt.where(Review.status == status)
+    return db.session.execute(stmt.order_by(Review.id.desc()).limit(limit)).scalars().all()
+
+def run(count, path):
+    if os.path.exists(path):
+        os.remove(path)
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{path}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        seed(count, random.Random(0))
+        print(f"Seeded {count:,} reviews in {time.perf_counter() - start:.1f}s")
+        start = time.perf_counter()
+        terms = rebuild_search_index()
+        print(f"Indexed {terms:,} terms in {time.perf_counter() - start:.1f}s")
+
+        queries = [
+            ("rare word", ["cracked"], None),
+            ("rare word, flagged only", ["overheats"], 'flagged'),
+            ("common word", ["word1"], None),
+            ("two mid-frequency words", ["word40", "word41"], None),
+        ]
+        print(f"{'query':<28}{'index (ms)':>12}{'LIKE (ms)':>12}{'speedup':>10}")
+        for label, words, status in queries:
+            index_time, _ = timed(lambda: search_reviews(" ".join(words), status=status))
+            like_time, _ = timed(lambda: like_scan(words, status))
+            print(f"{label:<28}{index_time * 1000:>12.1f}{like_time * 1000:>12.1f}{like_time / index_time:>9.1f}x")
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000000
+    path = sys.argv[2] if len(sys.argv) > 2 else "/tmp/benchmark_search.db"
+    run(count, path)
@@ -0,0 +1,115 @@
+# benchmark_serving.py
+#
+# Compares the development server (app.run(debug=True)) with the Gunicorn entry point
+# (gunicorn.conf.py) on the combined app. Both serve a throwaway SQLite database with
+# rate limiting disabled, and keep-alive clients hit /sales/display_goods at several
+# concurrency levels. Run from the repository root:
+#
+#     python -m profiling.benchmark_serving [seconds_per_level] [gunicorn_workers]
+#
+# The load generator runs on the same machine, so absolute numbers are a lower bound;
+# the comparison between servers is what matters.
+
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from flask import Flask
+from database.database import db, InventoryItem
+
+DB_PATH = "/tmp/benchmark_serving.db"
+PATH = "/sales/display_goods"
+CONCURRENCY = [1, 8, 32]
+
+def seed():
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{DB_PATH}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(InventoryItem(name=f"Item {i}", category="Electronics", price=10.0 + i, stock=5)
+                           for i in range(50))
+        db.session.commit()
+
+def serve_dev(port):
+    from app import app
+    app.run(port=port, debug=True)
+
+def start(name, port, workers):
+    env = dict(os.environ, SQLALCHEMY_DATABASE_URI=f"sqlite:///{DB_PATH}", FLASK_RATELIMIT_ENABLED="false",
+               GUNICORN_WORKERS=str(workers))
+    if name == "dev server":
+        cmd = [sys.executable, "-m", "profiling.benchmark_serving", "serve-dev", str(port)]
+    else:
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-b", f"127.0.0.1:{port}", "app:app"]
+    process = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            connection.request("GET", PATH)
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{name} did not start")
+
+def client(port, deadline, counts):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    ok = errors = 0
+    while time.perf_counter() < deadline:
+        try:
+            connection.request("GET", PATH)
+            response = connection.getresponse()
+            response.read()
+            if response.status == 200:
+                ok += 1
+            else:
+                errors += 1
+            if response.will_close:
+                connection.close()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            # Keep-alive connection dropped by a recycled worker (max_requests); reconnect
+            connection.close()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+    counts.append((ok, errors))
+
+def measure(port, concurrency, seconds):
+    counts = []
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=client, args=(port, deadline, counts)) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(ok for ok, _ in counts) / seconds, sum(errors for _, errors in counts)
+
+def run(seconds, workers):
+    seed()
+    results = {}
+    for port, name in ((5100, "dev server"), (5101, "gunicorn")):
+        process = start(name, port, workers)
+        try:
+            results[name] = [measure(port, concurrency, seconds) for concurrency in CONCURRENCY]
+        finally:
+            process.terminate()
+            process.wait()
+    print(f"{'clients':>8}{'dev server (req/s)':>22}{'gunicorn (req/s)':>20}{'speedup':>10}")
+    for i, concurrency in enumerate(CONCURRENCY):
+        (dev, dev_errors), (prod, prod_errors) = results["dev server"][i], results["gunicorn"][i]
+        note = f"  ({dev_errors} / {prod_errors} errors)" if dev_errors or prod_errors else ""
+        print(f"{concurrency:>8}{dev:>22.0f}{prod:>20.0f}{prod / dev:>9.1f}x{note}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "serve-dev":
+        serve_dev(int(sys.argv[2]))
+    else:
+        seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+        workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() * 2 + 1
+        run(seconds, workers)
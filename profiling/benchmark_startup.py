@@ -0,0 +1,44 @@
+# benchmark_startup.py
+#
+# Measures how long a fresh interpreter takes to build each app from the factory in
+# services/__init__.py, and its peak RSS afterwards. Every sample runs in a new process
+# so import caching does not hide the cost. Run from the repository root:
+#
+#     python -m profiling.benchmark_startup [runs]
+
+import statistics
+import subprocess
+import sys
+
+TARGETS = [
+    ("customers", "create_app(['customers'])"),
+    ("inventory", "create_app(['inventory'])"),
+    ("sales", "create_app(['sales'])"),
+    ("reviews", "create_app(['reviews'])"),
+    ("all services", "create_app()"),
+]
+
+SNIPPET = """
+import resource, time
+start = time.perf_counter()
+from services import create_app
+app = {call}
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def sample(call):
+    result = subprocess.run([sys.executable, "-c", SNIPPET.format(call=call)],
+                            capture_output=True, text=True, check=True)
+    seconds, max_rss_kb = result.stdout.split()
+    return float(seconds), int(max_rss_kb) / 1024
+
+def run(runs):
+    print(f"{'app':<16}{'startup (ms)':>14}{'peak RSS (MB)':>16}")
+    for label, call in TARGETS:
+        samples = [sample(call) for _ in range(runs)]
+        startup = statistics.median(seconds for seconds, _ in samples) * 1000
+        rss = statistics.median(rss for _, rss in samples)
+        print(f"{label:<16}{startup:>14.0f}{rss:>16.1f}")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 7)
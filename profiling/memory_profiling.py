@@ -1,3 +1,8 @@
+# memory_profiling.py
+#
+# Profiles the client side's memory for every API call. For the memory a service uses
+# to handle a request, see services/memory.py and profiling/memory_report.py instead.
+
 from memory_profiler import profile
 import requests
 
@@ -0,0 +1,52 @@
+# memory_report.py
+#
+# Reports a running service's memory use per route from the server's side, and what
+# grew while it served a batch of requests. Start the service with memory tracing and a
+# profile key (see services/memory.py), e.g. FLASK_MEMORY_TRACE=true
+# FLASK_PROFILE_KEY=secret GUNICORN_WORKERS=1 GUNICORN_THREADS=1, then run from the
+# repository root:
+#
+#     python -m profiling.memory_report <base URL> <profile key> [path] [requests]
+#
+# e.g. python -m profiling.memory_report http://localhost:5002 secret /inventory/get_items 500
+#
+# With one worker, every request reaches the traced process. Memory that grows with
+# the number of requests is a leak; repeat with more requests to tell it from caches
+# filling up.
+
+import sys
+import requests
+
+def kib(size):
+    return f"{size / 1024:.1f}"
+
+def run(base_url, key, path, count):
+    headers = {"X-Profile-Key": key}
+    requests.post(f"{base_url}/debug/memory/baseline", headers=headers).raise_for_status()
+    session = requests.Session()
+    for _ in range(count):
+        session.get(f"{base_url}{path}")
+    response = requests.get(f"{base_url}/debug/memory", headers=headers)
+    response.raise_for_status()
+    report = response.json()
+
+    print(f"traced now {kib(report['traced_bytes'])} KiB, peak {kib(report['traced_peak_bytes'])} KiB\n")
+    print(f"{'route':<40}{'requests':>9}{'peak avg (KiB)':>16}{'peak max (KiB)':>16}{'retained (KiB)':>16}")
+    for route, entry in report["routes"].items():
+        print(f"{route:<40}{entry['requests']:>9}{kib(entry['peak_bytes_avg']):>16}"
+              f"{kib(entry['peak_bytes_max']):>16}{kib(entry['retained_bytes_total']):>16}")
+    for route, entry in report["routes"].items():
+        print(f"\nretained by {route} ({entry['snapshots']} requests sampled)")
+        for site in entry["top_sites"]:
+            print(f"  {kib(site['bytes']):>10} KiB {site['blocks']:>8} blocks  {site['site']}")
+
+    growth = report["since_baseline"]
+    print(f"\ngrown by {kib(growth['grown_bytes'])} KiB over {growth['requests']} requests")
+    for site in growth["top_sites"]:
+        print(f"  {kib(site['bytes']):>10} KiB {site['blocks']:>8} blocks  {site['site']}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit("usage: python -m profiling.memory_report <base URL> <profile key> [path] [requests]")
+    run(sys.argv[1].rstrip("/"), sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else "/inventory/get_items",
+        int(sys.argv[4]) if len(sys.argv) > 4 else 200)
@@ -1,4 +1,8 @@
 # profile_requests.py
+#
+# Profiles the client side of every API call (the requests library and the network).
+# To profile how a service handles a request, send the X-Profile headers described in
+# services/profiler.py instead.
 
 import requests
 import cProfile
@@ -0,0 +1,288 @@
+"""
+ASGI deployment mode with an asyncio read path.
+
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker \\
+        gunicorn -c gunicorn.conf.py "services.asgi:create_asgi_app(services=['sales'])"
+
+The busiest read endpoints (``display_goods``, ``get_item``, ``get_customer`` and
+``get_product_reviews``) run as coroutines on the event loop and query MySQL through
+an asyncio engine (aiomysql, pooled like the synchronous engine), so a request waiting
+on the database holds no thread. They reuse the query builders and serializers of the
+Flask routes and return the same JSON, with the same ETag, Last-Modified and 304
+responses to conditional requests (see services/conditional.py). Every other route is served by the Flask app
+from :func:`services.create_app`, run in a thread pool.
+
+The async routes enforce the same per-service limits as the Flask blueprints, with
+the same client keys and costs, through the storage named by RATELIMIT_STORAGE_URI.
+With the in-memory and ``mmap://`` storages they share the Flask app's counters.
+"""
+import time
+from contextlib import asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from limits import parse
+from limits.aio.strategies import STRATEGIES
+from limits.storage import storage_from_string
+from starlette.applications import Starlette
+from starlette import responses
+from starlette.routing import Mount, Route
+from database.pool import create_async_database_engine
+from services import SERVICES, create_app
+from services.conditional import matched_etag, validator_headers
+from services.metrics import observe_request
+from services.ratelimit import bearer_token, token_identity
+from services.serialization import to_json
+
+
+class JSONResponse(responses.JSONResponse):
+    """
+    JSON response encoded like the Flask app's responses (see services/serialization.py).
+    """
+    def render(self, content):
+        return to_json(content)
+
+
+def not_modified(request, etag, modified=None, private=False):
+    """
+    Answers a request with 304 if the client's copy is current, as the Flask routes do.
+
+    Args:
+        request (Request): The current request.
+        etag (str): The response's current unquoted tag.
+        modified (datetime): Its Last-Modified time, or None.
+        private (bool): Whether shared caches must not store the response.
+
+    Returns:
+        Response: The 304 response, or None if the full response must be sent.
+    """
+    matched = matched_etag(request.headers, etag, modified)
+    if matched is None:
+        return None
+    return responses.Response(status_code=304, headers=validator_headers(matched, modified, private))
+
+
+async def fetch(request, stmt):
+    """
+    Runs a read-only query on the async engine.
+
+    Args:
+        request (Request): The current request.
+        stmt (Select): The query.
+
+    Returns:
+        list: The result rows.
+    """
+    async with request.app.state.engine.connect() as connection:
+        return (await connection.execute(stmt)).all()
+
+
+def customers_routes():
+    from services.customers.customers import (validate_username, customer_details_query, serialize_customer,
+                                              customer_validators)
+
+    async def get_customer(request):
+        username = request.path_params['username']
+        if not validate_username(username):
+            return JSONResponse({"error": "Invalid username format"}, status_code=400)
+        rows = await fetch(request, customer_details_query(username))
+        if not rows:
+            return JSONResponse({"error": "Customer not found"}, status_code=404)
+        etag, modified = customer_validators(rows[0])
+        response = not_modified(request, etag, modified, private=True)
+        if response is not None:
+            return response
+        return JSONResponse(serialize_customer(rows[0]), headers=validator_headers(etag, modified, private=True))
+
+    return [('/customer/{username}', get_customer)]
+
+
+def inventory_routes():
+    from services.inventory.inventory import item_details_query, serialize_item, item_validators
+
+    async def get_item(request):
+        rows = await fetch(request, item_details_query(request.path_params['name']))
+        if not rows:
+            return JSONResponse({"error": "Item not found."}, status_code=404)
+        etag, modified = item_validators(rows[0])
+        response = not_modified(request, etag, modified)
+        if response is not None:
+            return response
+        return JSONResponse(serialize_item(rows[0]), headers=validator_headers(etag, modified))
+
+    return [('/get_item/{name}', get_item)]
+
+
+def sales_routes():
+    from services.sales.sales import available_goods_query, serialize_goods
+
+    async def display_goods(request):
+        return JSONResponse(serialize_goods(await fetch(request, available_goods_query())))
+
+    return [('/display_goods', display_goods)]
+
+
+def reviews_routes():
+    from database.database import db, InventoryItem
+    from services.reviews.reviews import (product_reviews_query, serialize_product_review, review_page_query,
+                                          split_review_page, product_review_versions_query, product_reviews_etag)
+
+    async def get_product_reviews(request):
+        item_name = request.path_params['item_name']
+        items = await fetch(request, db.select(InventoryItem.id).where(InventoryItem.name == item_name))
+        if not items:
+            return JSONResponse({"error": "Item not found."}, status_code=404)
+        item_id = items[0].id
+        try:
+            if 'if-none-match' in request.headers:
+                stmt, _, _ = review_page_query(product_review_versions_query(item_id), request.query_params)
+                response = not_modified(request, product_reviews_etag(item_id, await fetch(request, stmt)))
+                if response is not None:
+                    return response
+            stmt, limit, column = review_page_query(product_reviews_query(item_id), request.query_params)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+
+        rows = await fetch(request, stmt)
+        reviews, next_cursor = split_review_page(rows, limit, column)
+        response = JSONResponse([serialize_product_review(review) for review in reviews],
+                                headers=validator_headers(product_reviews_etag(item_id, rows)))
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+
+    return [('/product_reviews/{item_name}', get_product_reviews)]
+
+
+ASYNC_ROUTES = {
+    'customers': customers_routes,
+    'inventory': inventory_routes,
+    'sales': sales_routes,
+    'reviews': reviews_routes,
+}
+
+
+def client_key(request, flask_app):
+    """
+    Identifies an async request's client the way ``rate_limit_key`` does for Flask.
+
+    Args:
+        request (Request): The current request.
+        flask_app (Flask): The wrapped Flask app, whose JWT settings decode the token.
+
+    Returns:
+        str: ``user:<identity>`` for a request with a valid bearer token, else the
+            client address.
+    """
+    token = bearer_token(request.headers.get('authorization'))
+    if token:
+        with flask_app.app_context():
+            identity = token_identity(token)
+        if identity is not None:
+            return f"user:{identity}"
+    return request.client.host if request.client else ''
+
+
+def rate_limited(service, flask_app, flask_endpoint, endpoint):
+    """
+    Applies a service's blueprint rate limit to an async endpoint, with the cost and
+    client key the Flask route would use, and records the endpoint's requests in the
+    route's metrics.
+
+    Args:
+        service (str): The name of the service in SERVICES.
+        flask_app (Flask): The wrapped Flask app.
+        flask_endpoint (str): The Flask endpoint serving the same URL, whose counter the
+            limit is kept under.
+        endpoint (callable): The endpoint coroutine.
+
+    Returns:
+        callable: The limited endpoint.
+    """
+    limit = parse(SERVICES[service][3])
+    cost = getattr(flask_app.view_functions[flask_endpoint], 'rate_limit_cost', 1)
+    metrics = flask_app.extensions['rate_limit_metrics']
+
+    async def limited(request):
+        state = request.app.state
+        start = time.perf_counter()
+        if state.rate_limiting:
+            allowed = await state.hit(limit, client_key(request, flask_app), flask_endpoint, cost=cost)
+            metrics.record(flask_endpoint, time.perf_counter() - start, not allowed)
+            if not allowed:
+                response = JSONResponse({"error": f"Rate limit exceeded: {limit}"}, status_code=429)
+                observe_request(flask_endpoint, time.perf_counter() - start, response.status_code)
+                return response
+        status = 500
+        try:
+            response = await endpoint(request)
+            status = response.status_code
+            return response
+        finally:
+            # Queries are not counted: the event loop thread interleaves many requests
+            observe_request(flask_endpoint, time.perf_counter() - start, status)
+
+    return limited
+
+
+def create_hit(flask_app):
+    """
+    Chooses how the async endpoints record hits against their rate limits.
+
+    Storages that live in the process's memory (``memory://`` and ``mmap://``) answer
+    in microseconds without I/O, so the Flask app's limiter is called directly and
+    both kinds of route count against the same limit. Other storages get an asyncio
+    limiter of their own.
+
+    Args:
+        flask_app (Flask): An app built by ``create_app``.
+
+    Returns:
+        callable: A coroutine function taking a limit, its identifiers and a cost, and
+            returning whether the hit is allowed.
+    """
+    uri = flask_app.config.get('RATELIMIT_STORAGE_URI', 'memory://')
+    if uri.split(':', 1)[0] in ('memory', 'mmap'):
+        limiter = next(iter(flask_app.extensions['limiter'])).limiter
+
+        async def hit(limit, *identifiers, cost=1):
+            return limiter.hit(limit, *identifiers, cost=cost)
+
+        return hit
+    strategy = STRATEGIES[flask_app.config['RATELIMIT_STRATEGY']]
+    return strategy(storage_from_string('async+' + uri)).hit
+
+
+def create_asgi_app(services=None, config=None):
+    """
+    Builds an ASGI app serving some or all of the services.
+
+    Args:
+        services (list): Names from SERVICES to register; all of them if omitted.
+        config (dict): Extra configuration values, as for ``create_app``.
+
+    Returns:
+        Starlette: The application. The Flask app it wraps is ``app.state.flask_app``.
+    """
+    flask_app = create_app(services, config)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # Created per worker, after any fork, inside the worker's event loop
+        app.state.engine = create_async_database_engine(flask_app)
+        yield
+        await app.state.engine.dispose()
+
+    flask_endpoints = {rule.rule: rule.endpoint for rule in flask_app.url_map.iter_rules()}
+    routes = []
+    for service in services or SERVICES:
+        url_prefix = SERVICES[service][2]
+        for path, endpoint in ASYNC_ROUTES[service]():
+            flask_endpoint = flask_endpoints[url_prefix + path.replace('{', '<').replace('}', '>')]
+            routes.append(Route(url_prefix + path, rate_limited(service, flask_app, flask_endpoint, endpoint),
+                                methods=['GET']))
+    routes.append(Mount('/', app=WSGIMiddleware(flask_app)))
+
+    app = Starlette(routes=routes, lifespan=lifespan)
+    app.state.flask_app = flask_app
+    app.state.rate_limiting = flask_app.config.get('RATELIMIT_ENABLED', True)
+    app.state.hit = create_hit(flask_app) if app.state.rate_limiting else None
+    return app
@@ -0,0 +1,249 @@
+"""
+Response compression for the apps built with ``services.create_app``.
+
+JSON and text responses of at least COMPRESS_MIN_SIZE bytes (default 1024) are
+compressed in the best coding the client lists in ``Accept-Encoding``: zstd when the
+zstandard package is installed, br when brotli is, and gzip always, preferred in that
+order when the client accepts several equally. Listings such as ``get_items`` are
+long runs of the same keys and compress to a few percent of their size.
+
+Streamed responses (such as the flagged review stream) are compressed as they are
+written, whatever their size, since it is not known in advance, and each chunk is
+flushed to the client as soon as it is compressed.
+
+Compressed bodies are cached by a digest of the uncompressed body, up to
+COMPRESS_CACHE_BYTES of compressed data (default 16 MiB), so a listing that has not
+changed since it was last sent is not compressed again. Hashing a body costs a small
+fraction of compressing it.
+
+A compressed response's ETag gets the coding appended (``"<tag>-gzip"``), since it is
+a different sequence of bytes from the uncompressed one; services/conditional.py
+accepts either form in ``If-None-Match``.
+
+Each compressed response reports its sizes and the time spent compressing in a
+``Server-Timing`` entry, e.g. ``compress;dur=0.84;desc="gzip 152000 to 9100 bytes"``.
+/metrics adds them up per coding (see services/metrics.py). COMPRESS_GZIP_LEVEL
+(default 6), COMPRESS_BROTLI_QUALITY (default 4) and COMPRESS_ZSTD_LEVEL (default 3)
+set the trade-off between bytes saved and CPU; COMPRESS_ENABLED=false turns it off.
+"""
+import hashlib
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from flask import request
+from services.metrics import observe_cache, observe_compression
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml')
+
+
+class _Gzip:
+    # Compressor interface shared by every coding: compress(chunk), sync() to emit
+    # everything compressed so far without ending the stream, then flush() once
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def sync(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def sync(self):
+        return self._compressor.flush()
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+class _Zstd:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def sync(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+def available_encodings(config):
+    """
+    Lists the content codings this process can produce, most preferred first.
+
+    Args:
+        config (Config): The app's configuration, for the compression levels.
+
+    Returns:
+        OrderedDict: Coding name to a function returning a new compressor.
+    """
+    encodings = OrderedDict()
+    if zstandard is not None:
+        level = int(config.get('COMPRESS_ZSTD_LEVEL', 3))
+        encodings['zstd'] = lambda: _Zstd(level)
+    if brotli is not None:
+        quality = int(config.get('COMPRESS_BROTLI_QUALITY', 4))
+        encodings['br'] = lambda: _Brotli(quality)
+    level = int(config.get('COMPRESS_GZIP_LEVEL', 6))
+    encodings['gzip'] = lambda: _Gzip(level)
+    return encodings
+
+
+class CompressedBodyCache:
+    """
+    Least recently used cache of compressed bodies, keyed by coding and body digest.
+
+    Args:
+        max_bytes (int): Most compressed bytes to hold.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+        observe_cache('compressed_bodies', body is not None)
+        return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._bodies:
+                return
+            self._bodies[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self.size -= len(self._bodies.popitem(last=False)[1])
+
+
+def compress_stream(chunks, encoding, compressor):
+    """
+    Compresses a streamed body as it is written.
+
+    Each chunk is compressed and flushed to the end of a block, so the client gets it
+    as soon as the uncompressed stream would deliver it rather than when the
+    compressor's buffer fills. Views should yield chunks of a useful size, such as a
+    page of rows, since every flush costs a few bytes and restarts block selection.
+
+    Args:
+        chunks (iterable): The body's chunks, as str or bytes.
+        encoding (str): The coding's name, for /metrics.
+        compressor: A compressor from :func:`available_encodings`.
+
+    Yields:
+        bytes: Compressed chunks.
+    """
+    size = compressed_size = 0
+    seconds = 0.0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            start = time.perf_counter()
+            output = compressor.compress(chunk) + compressor.sync()
+            seconds += time.perf_counter() - start
+            size += len(chunk)
+            if output:
+                compressed_size += len(output)
+                yield output
+        output = compressor.flush()
+        compressed_size += len(output)
+        yield output
+        observe_compression(encoding, size, compressed_size, seconds)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()  # Ends stream_with_context's request context
+
+
+def _compressible(response):
+    return (response.status_code >= 200 and response.status_code not in (204, 206, 304)
+            and 'Content-Encoding' not in response.headers and not response.direct_passthrough
+            and (response.mimetype.startswith('text/') or response.mimetype in COMPRESSIBLE_TYPES))
+
+
+def _encoded(response, encoding):
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+
+
+def init_compression(app):
+    """
+    Compresses an app's responses as negotiated by ``Accept-Encoding``.
+
+    Args:
+        app (Flask): The application.
+    """
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return
+    encodings = available_encodings(app.config)
+    names = list(encodings)
+    min_size = int(app.config.get('COMPRESS_MIN_SIZE', 1024))
+    cache = CompressedBodyCache(int(app.config.get('COMPRESS_CACHE_BYTES', 16 * 1024 * 1024)))
+
+    @app.after_request
+    def compress_response(response):
+        if response.status_code == 304 and 'ETag' in response.headers:
+            response.vary.add('Accept-Encoding')  # As the full response would have it
+        if not _compressible(response):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(names)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding, encodings[encoding]())
+            response.headers.pop('Content-Length', None)
+            _encoded(response, encoding)
+            return response
+
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+        start = time.perf_counter()
+        key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+        compressed = cache.get(key)
+        seconds = 0.0
+        if compressed is None:
+            compressor = encodings[encoding]()
+            compressed = compressor.compress(body) + compressor.flush()
+            seconds = time.perf_counter() - start
+            cache.put(key, compressed)
+        response.set_data(compressed)
+        _encoded(response, encoding)
+        response.headers.add('Server-Timing', f'compress;dur={(time.perf_counter() - start) * 1000:.2f};'
+                                              f'desc="{encoding} {len(body)} to {len(compressed)} bytes"')
+        observe_compression(encoding, len(body), len(compressed), seconds)
+        return response
@@ -0,0 +1,133 @@
+"""
+Conditional GETs for the item, customer and review reads.
+
+Those routes look up the versions of the rows a response is built from (see
+``Versioned`` in database/database.py) and derive a strong ETag from them, and a
+Last-Modified time where the rows' ``updated_at`` covers every change to the
+response. A client sending back ``If-None-Match`` (or, without one,
+``If-Modified-Since``) gets ``304 Not Modified`` with no body when its copy is
+current, so the route skips encoding, compressing and sending the response.
+
+services/compression.py appends the content coding to the ETag of a compressed
+response (``"<tag>-gzip"``), since each coding is a different sequence of bytes; a
+client sending either form back matches. Responses are marked ``no-cache``: caches
+may store them but must revalidate each time, which a 304 makes cheap. Customer
+details are ``private`` as well.
+"""
+import hashlib
+from datetime import timezone
+from flask import current_app, request
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
+
+CODINGS = ('gzip', 'br', 'zstd')
+
+
+def version_etag(*versions):
+    """
+    Derives a strong entity tag from the rows a response is built from.
+
+    Args:
+        *versions: The IDs and versions of the rows, in the response's order, plus
+            anything else the response depends on.
+
+    Returns:
+        str: The unquoted tag.
+    """
+    return hashlib.blake2b(repr(versions).encode(), digest_size=12).hexdigest()
+
+
+def last_modified(*times):
+    """
+    Gives the Last-Modified time of a response built from several rows.
+
+    Args:
+        *times (datetime): The rows' ``updated_at`` values, in UTC.
+
+    Returns:
+        datetime: The latest of them to the second, as HTTP dates have it, or None.
+    """
+    times = [value for value in times if value is not None]
+    if not times:
+        return None
+    return max(times).replace(microsecond=0, tzinfo=timezone.utc)
+
+
+def matched_etag(headers, etag, modified=None):
+    """
+    Checks a request's validators against the current version of a response.
+
+    ``If-None-Match`` takes precedence over ``If-Modified-Since``, as RFC 9110 requires.
+
+    Args:
+        headers (Mapping): The request headers.
+        etag (str): The response's current unquoted tag.
+        modified (datetime): Its Last-Modified time, or None.
+
+    Returns:
+        str: The tag to send with a 304 response, or None if the client's copy is out
+            of date or it sent no validators.
+    """
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match:
+        tags = parse_etags(if_none_match)
+        if tags.star_tag:
+            return etag
+        return next((tag for tag in (etag, *(f"{etag}-{coding}" for coding in CODINGS))
+                     if tags.contains_weak(tag)), None)
+    since = parse_date(headers.get('If-Modified-Since'))
+    if since is not None and modified is not None and modified <= since:
+        return etag
+    return None
+
+
+def validator_headers(etag, modified=None, private=False):
+    """
+    Builds the validator and caching headers of a conditional response.
+
+    Args:
+        etag (str): The unquoted tag.
+        modified (datetime): The Last-Modified time, or None.
+        private (bool): Whether shared caches must not store the response.
+
+    Returns:
+        dict: The headers.
+    """
+    headers = {'ETag': quote_etag(etag), 'Cache-Control': 'private, no-cache' if private else 'no-cache'}
+    if modified is not None:
+        headers['Last-Modified'] = http_date(modified)
+    return headers
+
+
+def not_modified(etag, modified=None, private=False):
+    """
+    Answers the current Flask request with 304 if the client's copy is current.
+
+    Args:
+        etag (str): The response's current unquoted tag.
+        modified (datetime): Its Last-Modified time, or None.
+        private (bool): Whether shared caches must not store the response.
+
+    Returns:
+        Response: The 304 response, or None if the full response must be sent.
+    """
+    matched = matched_etag(request.headers, etag, modified)
+    if matched is None:
+        return None
+    return current_app.response_class(status=304, headers=validator_headers(matched, modified, private))
+
+
+def with_validators(response, etag, modified=None, private=False):
+    """
+    Adds validator and caching headers to a full Flask response.
+
+    Args:
+        response (Response): The response.
+        etag (str): The unquoted tag.
+        modified (datetime): The Last-Modified time, or None.
+        private (bool): Whether shared caches must not store the response.
+
+    Returns:
+        Response: The response.
+    """
+    response.headers.update(validator_headers(etag, modified, private))
+    return response
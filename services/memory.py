@@ -0,0 +1,190 @@
+"""
+Server-side memory tracing with tracemalloc, for apps built with ``services.create_app``.
+
+With MEMORY_TRACE set (FLASK_MEMORY_TRACE=true), the app starts tracemalloc. For each
+route (Flask endpoint) it keeps the peak traced memory its requests reached above
+their starting point and the memory they left allocated. Around every
+MEMORY_TRACE_SITES_EVERY-th request of a route (default 10) it also takes snapshots
+and keeps the source lines that allocated what the request left behind; comparing
+two snapshots takes some 100 ms, so doing it for every request would swamp the
+figures it explains. tracemalloc slows every allocation, so this is a mode for
+finding a problem, never for serving traffic. tracemalloc traces the whole process:
+with several threads per worker, a request's figures include whatever the other
+threads allocated meanwhile, so run the worker with one thread (GUNICORN_THREADS=1)
+to attribute memory exactly.
+
+Two routes, which need PROFILE_KEY's ``X-Profile-Key`` header (see
+services/profiler.py), report what was traced:
+
+- ``POST /debug/memory/baseline`` takes the snapshot later requests are compared to.
+- ``GET /debug/memory`` returns the per-route figures and, after a baseline, the source
+  lines whose memory grew since then and how many requests were served meanwhile.
+  Memory that keeps growing with the request count is a leak.
+
+profiling/memory_report.py drives both routes and prints a report.
+"""
+import sys
+import threading
+import tracemalloc
+from flask import jsonify, request
+
+# Allocations by tracemalloc and this module are the measurement, not the app
+IGNORED_FILES = {tracemalloc.__file__, __file__}
+
+_local = threading.local()
+_lock = threading.Lock()  # Guards the module state below
+_routes = {}  # route: {'requests', 'peak_bytes_max', 'peak_bytes_total', 'retained_bytes_total', 'snapshots', 'sites'}
+_baseline = None  # (snapshot, requests served when it was taken)
+_served = 0
+
+
+def _site(traceback, prefixes):
+    # "path:line" of the allocating frame, with the path relative to its sys.path entry
+    frame = traceback[0]
+    filename = frame.filename
+    for prefix in prefixes:
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):]
+            break
+    return f"{filename}:{frame.lineno}"
+
+
+def _path_prefixes():
+    return sorted((path.rstrip('/') + '/' for path in sys.path if path), key=len, reverse=True)
+
+
+def _growth(after, before):
+    # Per source line, what grew from before to after. Filtering the lines rather than
+    # the snapshots' traces is much faster: Snapshot.filter_traces matches every trace.
+    return [stat for stat in after.compare_to(before, 'lineno')
+            if stat.size_diff > 0 and stat.traceback[0].filename not in IGNORED_FILES]
+
+
+def record_request(route, peak, retained, before=None, after=None):
+    """
+    Adds a request's memory figures to its route.
+
+    Args:
+        route (str): The route's name, normally its Flask endpoint.
+        peak (int): Most traced bytes during the request, above its start.
+        retained (int): Traced bytes at the end of the request, above its start.
+        before (Snapshot): Snapshot taken when the request started, if one was.
+        after (Snapshot): Snapshot taken when the request finished, if one was.
+    """
+    global _served
+    prefixes = _path_prefixes()
+    grown = [] if before is None else [(_site(stat.traceback, prefixes), stat.size_diff, stat.count_diff)
+                                       for stat in _growth(after, before)]
+    with _lock:
+        _served += 1
+        entry = _routes.get(route)
+        if entry is None:
+            entry = _routes[route] = {'requests': 0, 'peak_bytes_max': 0, 'peak_bytes_total': 0,
+                                      'retained_bytes_total': 0, 'snapshots': 0, 'sites': {}}
+        entry['requests'] += 1
+        entry['peak_bytes_max'] = max(entry['peak_bytes_max'], peak)
+        entry['peak_bytes_total'] += peak
+        entry['retained_bytes_total'] += retained
+        entry['snapshots'] += before is not None
+        for site, size, count in grown:
+            totals = entry['sites'].setdefault(site, [0, 0])
+            totals[0] += size
+            totals[1] += count
+
+
+def memory_report(top=10):
+    """
+    Reports the traced memory.
+
+    Args:
+        top (int): How many allocation sites to list per route and for the baseline.
+
+    Returns:
+        dict: The traced memory now, the figures of every route and, after a baseline
+            was taken, the sites that grew since.
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    with _lock:
+        routes = {route: dict(entry, sites=dict(entry['sites'])) for route, entry in _routes.items()}
+        baseline, served = _baseline, _served
+    report = {'traced_bytes': current, 'traced_peak_bytes': peak, 'routes': {}}
+    for route, entry in sorted(routes.items()):
+        sites = sorted(entry.pop('sites').items(), key=lambda item: item[1][0], reverse=True)[:top]
+        report['routes'][route] = dict(
+            entry,
+            peak_bytes_avg=entry['peak_bytes_total'] // entry['requests'],
+            top_sites=[{'site': site, 'bytes': size, 'blocks': count} for site, (size, count) in sites])
+    if baseline is not None:
+        snapshot, served_then = baseline
+        prefixes = _path_prefixes()
+        growth = _growth(tracemalloc.take_snapshot(), snapshot)
+        report['since_baseline'] = {
+            'requests': served - served_then,
+            'grown_bytes': sum(stat.size_diff for stat in growth),
+            'top_sites': [{'site': _site(stat.traceback, prefixes), 'bytes': stat.size_diff,
+                           'blocks': stat.count_diff} for stat in growth[:top]],
+        }
+    return report
+
+
+def init_memory_tracing(app):
+    """
+    Traces an app's memory per request when MEMORY_TRACE is set, and adds the
+    ``/debug/memory`` routes when PROFILE_KEY is also set.
+
+    Args:
+        app (Flask): The application.
+    """
+    from services.profiler import has_profile_key
+    from services.ratelimit import rate_limit_exempt
+
+    if not app.config.get('MEMORY_TRACE'):
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(int(app.config.get('MEMORY_TRACE_FRAMES', 1)))
+    key = app.config.get('PROFILE_KEY')
+    top = int(app.config.get('MEMORY_TRACE_TOP', 10))
+    sites_every = int(app.config.get('MEMORY_TRACE_SITES_EVERY', 10))
+
+    @app.before_request
+    def start_memory_trace():
+        _local.trace = None
+        if request.endpoint in ('memory_report', 'memory_baseline') or not tracemalloc.is_tracing():
+            return  # Reports would only measure themselves
+        route = request.endpoint or 'unmatched'
+        served = _routes.get(route, {}).get('requests', 0)
+        before = tracemalloc.take_snapshot() if served % sites_every == 0 else None
+        tracemalloc.reset_peak()
+        _local.trace = (route, before, tracemalloc.get_traced_memory()[0])
+
+    @app.teardown_request
+    def finish_memory_trace(exc):
+        trace = getattr(_local, 'trace', None)
+        _local.trace = None
+        if trace is not None and tracemalloc.is_tracing():
+            route, before, start = trace
+            current, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot() if before is not None else None
+            record_request(route, peak - start, current - start, before, after)
+
+    if not key:
+        return
+
+    @rate_limit_exempt
+    def memory_baseline():
+        global _baseline
+        if not has_profile_key(key):
+            return jsonify({"error": "Invalid profile key."}), 403
+        snapshot = tracemalloc.take_snapshot()
+        with _lock:
+            _baseline = (snapshot, _served)
+        return jsonify({"message": "Baseline taken.", "traced_bytes": tracemalloc.get_traced_memory()[0]}), 200
+
+    @rate_limit_exempt
+    def memory_report_view():
+        if not has_profile_key(key):
+            return jsonify({"error": "Invalid profile key."}), 403
+        return jsonify(memory_report(request.args.get('top', top, type=int))), 200
+
+    app.add_url_rule('/debug/memory/baseline', 'memory_baseline', memory_baseline, methods=['POST'])
+    app.add_url_rule('/debug/memory', 'memory_report', memory_report_view)
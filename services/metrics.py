@@ -0,0 +1,472 @@
+"""
+Prometheus metrics for every service, served at ``/metrics`` by apps built with
+``services.create_app``.
+
+Per blueprint route (the Flask endpoint, e.g. ``customers.get_customer``) it reports
+requests, 5xx errors, a latency histogram, and the number and total time of the SQL
+statements the requests ran. It also reports the connection pools, the rate limiter
+(see services/ratelimit.py) and the hits and misses of SQLAlchemy's compiled
+statement cache, the rate limiter's JWT cache and the compressed response cache, and
+how much response compression saved and cost (see services/compression.py).
+
+Counters are kept per thread: each worker thread only ever writes its own lists, so
+recording a request takes no lock, and a scrape adds up every thread's lists.
+
+Gunicorn workers are separate processes and a scrape reaches only one of them. When
+METRICS_DIR is set (FLASK_METRICS_DIR in the environment), every worker writes its
+totals to ``<METRICS_DIR>/<pid>.json`` every METRICS_PUBLISH_SECONDS (default 5), and
+a scrape adds the other workers' latest files to its own live totals. When a worker
+exits (recycled after GUNICORN_MAX_REQUESTS, or killed), the next scrape folds its
+counters into ``<METRICS_DIR>/retired.json`` and deletes its file (see
+:func:`retire_exited_workers`), so counters never go backwards and files do not pile
+up. Pool
+gauges (connections open, in use, idle and overflowing) describe a live process, so
+only live workers' gauges are reported.
+
+Each request also keeps its statements by shape (the SQL text before parameters are
+bound). A request that runs more than DB_QUERY_BUDGET statements (default 20), or one
+shape more than DB_QUERY_REPEAT_BUDGET times (default 5, the mark of an N+1 loop),
+logs a warning naming the most repeated statement; a budget of 0 turns its check
+off. With DB_QUERY_HEADERS set, responses report the request's statements in
+``X-DB-Queries`` and their time in ``Server-Timing``.
+"""
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+
+# Upper bounds in seconds, as in the Prometheus client libraries
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Per route: requests, errors, seconds, queries, query seconds, then a count per bucket and +Inf
+REQUESTS, ERRORS, SECONDS, QUERIES, QUERY_SECONDS, FIRST_BUCKET = range(6)
+# Pool status fields that are current state rather than totals
+POOL_GAUGES = ('size', 'in_use', 'idle', 'overflow')
+RETIRED = 'retired.json'
+
+_local = threading.local()
+_threads = []  # every thread's (routes, caches, compression) dicts
+_threads_lock = threading.Lock()
+_publisher_pid = None
+
+
+def _thread_stats():
+    # The calling thread's (routes, caches, compression) dicts, registered on first use
+    stats = getattr(_local, 'stats', None)
+    if stats is None:
+        stats = _local.stats = ({}, {}, {})
+        with _threads_lock:
+            _threads.append(stats)
+    return stats
+
+
+def observe_request(route, seconds, status, queries=0, query_seconds=0.0):
+    """
+    Records a finished request.
+
+    Args:
+        route (str): The route's name, normally its Flask endpoint.
+        seconds (float): Time from the start of the request to the response.
+        status (int): The response status; 5xx counts as an error.
+        queries (int): SQL statements the request ran.
+        query_seconds (float): Time spent in those statements.
+    """
+    routes = _thread_stats()[0]
+    entry = routes.get(route)
+    if entry is None:
+        entry = routes[route] = [0, 0, 0.0, 0, 0.0] + [0] * (len(BUCKETS) + 1)
+    entry[REQUESTS] += 1
+    if status >= 500:
+        entry[ERRORS] += 1
+    entry[SECONDS] += seconds
+    entry[QUERIES] += queries
+    entry[QUERY_SECONDS] += query_seconds
+    entry[FIRST_BUCKET + bisect_left(BUCKETS, seconds)] += 1
+
+
+def observe_cache(cache, hit):
+    """
+    Records a lookup in one of the caches reported at /metrics.
+
+    Args:
+        cache (str): The cache's name.
+        hit (bool): Whether the lookup found its entry.
+    """
+    caches = _thread_stats()[1]
+    entry = caches.get(cache)
+    if entry is None:
+        entry = caches[cache] = [0, 0]
+    entry[0 if hit else 1] += 1
+
+
+def observe_compression(encoding, size, compressed_size, seconds):
+    """
+    Records a compressed response.
+
+    Args:
+        encoding (str): The content coding, e.g. ``gzip``.
+        size (int): Bytes before compression.
+        compressed_size (int): Bytes sent.
+        seconds (float): Time spent compressing; 0 if the body came from the cache.
+    """
+    compression = _thread_stats()[2]
+    entry = compression.get(encoding)
+    if entry is None:
+        entry = compression[encoding] = [0, 0, 0, 0.0]
+    entry[0] += 1
+    entry[1] += size
+    entry[2] += compressed_size
+    entry[3] += seconds
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is None:
+        return
+    if context.cache_hit is CACHE_HIT or context.cache_hit is CACHE_MISS:
+        observe_cache('sql_compiled', context.cache_hit is CACHE_HIT)
+    # Only statements run for a request on this thread are added to its route
+    current = getattr(_local, 'request', None)
+    if current is not None:
+        current[3] += 1
+        current[4] += time.perf_counter() - context.metrics_start
+        shapes = current[5]
+        shapes[statement] = shapes.get(statement, 0) + 1
+
+
+def check_query_budget(logger, description, queries, shapes, budget, repeat_budget):
+    """
+    Logs a warning if a request ran too many SQL statements or repeated one too often.
+
+    Args:
+        logger (Logger): Where to log the warning.
+        description (str): The request, e.g. ``GET /sales/purchase_history/alice``.
+        queries (int): Statements the request ran.
+        shapes (dict): Times each statement's SQL text was run.
+        budget (int): Statements allowed per request; 0 for no limit.
+        repeat_budget (int): Runs allowed per statement shape; 0 for no limit.
+
+    Returns:
+        bool: Whether a warning was logged.
+    """
+    if (not budget or queries <= budget) and (not repeat_budget or queries <= repeat_budget):
+        return False  # No shape can have run more often than all statements together
+    statement, repeats = max(shapes.items(), key=lambda shape: shape[1], default=('', 0))
+    over_budget = budget and queries > budget
+    repeated = repeat_budget and repeats > repeat_budget
+    if not (over_budget or repeated):
+        return False
+    logger.warning("%s ran %d SQL statements%s; %s %d times: %s", description, queries,
+                   f" (budget {budget})" if over_budget else "",
+                   "possible N+1, ran" if repeated else "most repeated, ran", repeats,
+                   ' '.join(statement.split())[:300])
+    return True
+
+
+def snapshot():
+    """
+    Adds up this process's counters.
+
+    Returns:
+        dict: Per-route and per-cache counters, and the pool and rate limit status of
+            the current app.
+    """
+    from database.pool import pool_status
+    from services.ratelimit import rate_limit_status
+
+    routes, caches, compression = {}, {}, {}
+    with _threads_lock:
+        threads = list(_threads)
+    for thread_routes, thread_caches, thread_compression in threads:
+        for totals, counters in ((routes, thread_routes), (caches, thread_caches),
+                                 (compression, thread_compression)):
+            for name, values in list(counters.items()):
+                total = totals.setdefault(name, [0] * len(values))
+                for i, value in enumerate(values):
+                    total[i] += value
+    return {'routes': routes, 'caches': caches, 'compression': compression, 'pools': pool_status(),
+            'rate_limit': rate_limit_status()}
+
+
+def _merge(total, other):
+    # Adds other into total; values named *_max are the largest seen instead
+    for key, value in other.items():
+        if isinstance(value, dict):
+            _merge(total.setdefault(key, {}), value)
+        elif isinstance(value, list):
+            current = total.setdefault(key, [0] * len(value))
+            total[key] = [a + b for a, b in zip(current, value)]
+        elif key in total and isinstance(value, (int, float)):
+            total[key] = max(total[key], value) if key.endswith('_max') else total[key] + value
+        else:
+            total[key] = value
+    return total
+
+
+def _write_totals(app, path):
+    with app.app_context():
+        data = json.dumps(snapshot())
+    with open(path + '.tmp', 'w') as file:
+        file.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def _publish(app, directory, interval):
+    # Runs in each worker, writing its totals for the workers that answer scrapes, and
+    # once more when the worker exits, so a recycled worker's last requests are kept
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    retire_exited_workers(directory, [os.getpid()])  # A file with this pid is an exited worker's
+    atexit.register(_write_totals, app, path)
+    while True:
+        time.sleep(interval)
+        _write_totals(app, path)
+
+
+def _counters(published):
+    # A published snapshot without its pool gauges, which only a live process can report
+    for status in published.get('pools', {}).values():
+        for field in POOL_GAUGES:
+            status.pop(field, None)
+    return published
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists, owned by another user
+    return True
+
+
+def _read(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def _exited_workers(directory):
+    return [int(name[:-5]) for name in os.listdir(directory)
+            if name.endswith('.json') and name[:-5].isdigit() and not _alive(int(name[:-5]))]
+
+
+def retire_exited_workers(directory, pids=None):
+    """
+    Folds the published counters of workers that have exited into the retired totals
+    and deletes their files.
+
+    The retired totals list the workers folded into them whose files still exist, so
+    a scrape racing the deletion counts each worker once. A lock on
+    ``<METRICS_DIR>/retired.lock`` keeps two workers from retiring the same file.
+
+    Args:
+        directory (str): The METRICS_DIR.
+        pids (list): The workers to retire; by default every one that has exited.
+    """
+    if pids is None and not _exited_workers(directory):
+        return
+    with open(os.path.join(directory, 'retired.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        for pid in _exited_workers(directory) if pids is None else pids:
+            _retire(directory, pid)
+
+
+def _retire(directory, pid):
+    path = os.path.join(directory, f"{pid}.json")
+    try:
+        published = _read(path)
+    except (OSError, ValueError):
+        published = None  # Exited before publishing
+    if published is not None:
+        retired_path = os.path.join(directory, RETIRED)
+        try:
+            retired = _read(retired_path)
+        except (OSError, ValueError):
+            retired = {'pids': [], 'totals': {}}
+        pids = [other for other in retired['pids'] if os.path.exists(os.path.join(directory, f"{other}.json"))]
+        retired = {'pids': pids + [pid], 'totals': _merge(retired['totals'], _counters(published))}
+        with open(retired_path + '.tmp', 'w') as file:
+            json.dump(retired, file)
+        os.replace(retired_path + '.tmp', retired_path)
+    for name in (path, path + '.tmp'):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+def collect():
+    """
+    Returns:
+        dict: This process's counters, plus every other worker's latest published
+            counters and the retired workers' totals when METRICS_DIR is set.
+    """
+    totals = snapshot()
+    directory = current_app.config.get('METRICS_DIR')
+    if directory:
+        retire_exited_workers(directory)
+        own = f"{os.getpid()}.json"
+        published = {}
+        for name in os.listdir(directory):
+            if name.endswith('.json') and name != own and name[:-5].isdigit():
+                try:
+                    published[int(name[:-5])] = _read(os.path.join(directory, name))
+                except (OSError, ValueError):
+                    continue  # Being replaced or retired; counted by the next scrape or the retired totals
+        # Read after the workers' files: a worker retired meanwhile is listed here, and skipped below
+        try:
+            retired = _read(os.path.join(directory, RETIRED))
+        except (OSError, ValueError):
+            retired = {'pids': [], 'totals': {}}
+        _merge(totals, retired['totals'])
+        for pid, counters in published.items():
+            if pid not in retired['pids']:
+                _merge(totals, counters if _alive(pid) else _counters(counters))
+    return totals
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+
+def render(totals):
+    """
+    Formats counters in the Prometheus text exposition format.
+
+    Args:
+        totals (dict): Counters from :func:`collect`.
+
+    Returns:
+        str: The exposition.
+    """
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{name}{suffix} {value}" for suffix, value in samples)
+
+    routes = sorted(totals['routes'].items())
+    metric('http_requests_total', 'counter', 'Requests served, by route.',
+           [(_labels(route=route), values[REQUESTS]) for route, values in routes])
+    metric('http_request_errors_total', 'counter', 'Requests answered with a 5xx status, by route.',
+           [(_labels(route=route), values[ERRORS]) for route, values in routes])
+    histogram = []
+    for route, values in routes:
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), values[FIRST_BUCKET:]):
+            cumulative += count
+            histogram.append((f"_bucket{_labels(route=route, le=bound)}", cumulative))
+        histogram.append((f"_sum{_labels(route=route)}", round(values[SECONDS], 6)))
+        histogram.append((f"_count{_labels(route=route)}", values[REQUESTS]))
+    metric('http_request_duration_seconds', 'histogram', 'Time to respond, by route.', histogram)
+    metric('db_queries_total', 'counter', 'SQL statements run by requests, by route.',
+           [(_labels(route=route), values[QUERIES]) for route, values in routes])
+    metric('db_query_seconds_total', 'counter', 'Time spent in SQL statements run by requests, by route.',
+           [(_labels(route=route), round(values[QUERY_SECONDS], 6)) for route, values in routes])
+
+    pools = sorted(totals['pools'].items())
+    for field, kind, help_text in (
+            ('size', 'gauge', 'Connections the pool keeps open.'),
+            ('in_use', 'gauge', 'Connections checked out.'),
+            ('idle', 'gauge', 'Connections waiting in the pool.'),
+            ('overflow', 'gauge', 'Connections open beyond the pool size.'),
+            ('checkouts', 'counter', 'Connections handed out.'),
+            ('timeouts', 'counter', 'Checkouts that gave up waiting for a connection.'),
+            ('wait_seconds_total', 'counter', 'Time spent waiting for a connection.')):
+        name = f"db_pool_{field}" if kind == 'gauge' or field.endswith('_total') else f"db_pool_{field}_total"
+        metric(name, kind, help_text,
+               [(_labels(bind=bind), status[field]) for bind, status in pools if field in status])
+
+    caches = sorted(totals['caches'].items())
+    metric('cache_hits_total', 'counter', 'Cache lookups that found their entry.',
+           [(_labels(cache=cache), hits) for cache, (hits, misses) in caches])
+    metric('cache_misses_total', 'counter', 'Cache lookups that did not.',
+           [(_labels(cache=cache), misses) for cache, (hits, misses) in caches])
+    metric('cache_hit_ratio', 'gauge', 'Share of cache lookups that found their entry.',
+           [(_labels(cache=cache), round(hits / (hits + misses), 6)) for cache, (hits, misses) in caches
+            if hits + misses])
+
+    compression = sorted(totals.get('compression', {}).items())
+    for field, name, help_text in (
+            (0, 'http_compressed_responses_total', 'Responses compressed, by encoding.'),
+            (1, 'http_compression_input_bytes_total', 'Response bytes before compression, by encoding.'),
+            (2, 'http_compression_output_bytes_total', 'Response bytes sent after compression, by encoding.'),
+            (3, 'http_compression_seconds_total', 'Time spent compressing responses, by encoding.')):
+        metric(name, 'counter', help_text,
+               [(_labels(encoding=encoding), round(values[field], 6)) for encoding, values in compression])
+
+    rate_limit = totals['rate_limit']
+    metric('rate_limit_checks_total', 'counter', 'Rate limit decisions made.', [('', rate_limit['checks'])])
+    metric('rate_limit_decision_seconds_total', 'counter', 'Time spent making rate limit decisions.',
+           [('', rate_limit['decision_seconds_total'])])
+    metric('rate_limit_rejections_total', 'counter', 'Requests rejected by a rate limit, by route.',
+           [(_labels(route=route), count) for route, count in sorted(rate_limit['rejections'].items())])
+    return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app):
+    """
+    Instruments an app's requests and adds its ``/metrics`` route.
+
+    Args:
+        app (Flask): The application.
+    """
+    from services.ratelimit import rate_limit_exempt
+
+    directory = app.config.get('METRICS_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    @app.before_request
+    def start_request_metrics():
+        global _publisher_pid
+        if directory and _publisher_pid != os.getpid():
+            # First request in this worker: threads do not survive Gunicorn's fork
+            _publisher_pid = os.getpid()
+            interval = float(app.config.get('METRICS_PUBLISH_SECONDS', 5))
+            threading.Thread(target=_publish, args=(app, directory, interval), daemon=True).start()
+        # route, start, status, queries, query seconds, runs per statement shape, description;
+        # the status is kept if no response is made
+        _local.request = [request.endpoint or 'unmatched', time.perf_counter(), 500, 0, 0.0, {},
+                          f"{request.method} {request.path}"]
+
+    @app.after_request
+    def record_status(response):
+        current = getattr(_local, 'request', None)
+        if current is not None:
+            current[2] = response.status_code
+            if app.config.get('DB_QUERY_HEADERS'):
+                response.headers['X-DB-Queries'] = str(current[3])
+                response.headers.add('Server-Timing', f'db;dur={current[4] * 1000:.2f};desc="{current[3]} queries", '
+                                                      f'app;dur={(time.perf_counter() - current[1]) * 1000:.2f}')
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        current = getattr(_local, 'request', None)
+        _local.request = None
+        if current is not None:
+            route, start, status, queries, query_seconds, shapes, description = current
+            observe_request(route, time.perf_counter() - start, 500 if exc is not None else status, queries,
+                            query_seconds)
+            check_query_budget(app.logger, description, queries, shapes, app.config.get('DB_QUERY_BUDGET', 20),
+                               app.config.get('DB_QUERY_REPEAT_BUDGET', 5))
+
+    @rate_limit_exempt
+    def metrics():
+        return Response(render(collect()), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
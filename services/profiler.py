@@ -0,0 +1,249 @@
+"""
+On-demand cProfile of single requests, for apps built with ``services.create_app``.
+
+A request is profiled when it sends ``X-Profile: 1`` with an ``X-Profile-Key``
+header equal to PROFILE_KEY, or when PROFILE_SAMPLE_RATE is above 0 and the request
+is picked at that rate (e.g. 0.001 for one request in a thousand). Both are off by
+default, and an app with neither one set registers no hooks at all.
+
+The profiler runs from the app's first before_request hook to its last after_request
+hook, so it also covers the rate limit check. Each profile is saved as
+``<PROFILE_DIR>/<endpoint>-<time>-<pid>.pstats``; open it with ``pstats.Stats`` or a
+viewer such as snakeviz. Only the newest PROFILE_KEEP files are kept (default 100).
+The response to a requested profile names its file in ``X-Profile-File`` and lists
+the PROFILE_TOP functions with the most cumulative time in ``X-Profile-Summary``
+(default 10). Responses to sampled requests are not changed.
+
+cProfile only sees the thread that enabled it. From Python 3.12 only one profiler can
+run per process, so a request that arrives while another is being profiled is not
+profiled.
+
+For a worker that is busy and you don't know why, ``GET /debug/profile?seconds=N`` (with
+the same ``X-Profile-Key``) samples the stacks of every other thread in the worker
+that serves it. It samples PROFILE_SAMPLE_HZ times a second (default 100) for N seconds
+(default 10, at most PROFILE_MAX_SECONDS, default 60) and returns folded stacks, one
+``thread;outer frame;...;inner frame count`` line per stack, which flamegraph.pl and
+speedscope read as they are. Nothing runs between these requests, and while one runs it
+costs about 1% of a CPU; only one runs per worker at a time. Under Gunicorn each request
+reaches one worker, so repeat it to see the others.
+"""
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import sys
+import tempfile
+import threading
+import time
+from flask import Response, jsonify, request
+
+_local = threading.local()
+_sampling = threading.Lock()  # Held while /debug/profile samples
+
+
+def has_profile_key(key):
+    """
+    Checks the current request's ``X-Profile-Key`` header.
+
+    Args:
+        key (str): The configured PROFILE_KEY; no request has the key if it is not set.
+
+    Returns:
+        bool: Whether the header matches.
+    """
+    return bool(key) and hmac.compare_digest(request.headers.get('X-Profile-Key', '').encode(), key.encode())
+
+
+def requested_profile(key):
+    """
+    Checks whether the current request asks to be profiled.
+
+    Args:
+        key (str): The configured PROFILE_KEY.
+
+    Returns:
+        bool: Whether the request sends ``X-Profile: 1`` and the right ``X-Profile-Key``.
+    """
+    return request.headers.get('X-Profile') == '1' and has_profile_key(key)
+
+
+def save_profile(profiler, directory, endpoint, keep):
+    """
+    Writes a profile to the profile directory and removes the oldest beyond ``keep``.
+
+    Args:
+        profiler (Profile): The finished profiler.
+        directory (str): Where profiles are kept.
+        endpoint (str): The request's Flask endpoint, used in the file name.
+        keep (int): How many profiles to keep.
+
+    Returns:
+        str: The new file's name.
+    """
+    name = f"{endpoint or 'unmatched'}-{time.time():.6f}-{os.getpid()}.pstats"
+    profiler.dump_stats(os.path.join(directory, name))
+    profiles = sorted((entry.stat().st_mtime, entry.path) for entry in os.scandir(directory)
+                      if entry.name.endswith('.pstats'))
+    for _, path in profiles[:-keep]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # Removed by another worker
+    return name
+
+
+def summarize(profiler, top):
+    """
+    Lists the functions with the most cumulative time.
+
+    Args:
+        profiler (Profile): The finished profiler.
+        top (int): How many functions to list.
+
+    Returns:
+        list: Entries such as ``"12.31ms sales.py:153(get_purchase_history)"``.
+    """
+    stats = pstats.Stats(profiler).strip_dirs().sort_stats('cumulative')
+    return [f"{stats.stats[function][3] * 1000:.2f}ms {pstats.func_std_string(function)}"
+            for function in stats.fcn_list[:top]]
+
+
+def _frame_label(code, prefixes):
+    # "function (path:first line)", with the path relative to its sys.path entry
+    filename = code.co_filename
+    for prefix in prefixes:
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):]
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds, hz, skip=()):
+    """
+    Samples the stacks of the process's threads.
+
+    Args:
+        seconds (float): How long to sample for.
+        hz (float): Samples per second.
+        skip (set): Thread idents to leave out, such as the caller's.
+
+    Returns:
+        tuple: ({folded stack: times seen}, number of samples taken). A folded stack
+            is the thread's name and its frames from the outermost, joined with ``;``.
+    """
+    prefixes = sorted((os.path.join(path, '') for path in sys.path if path), key=len, reverse=True)
+    labels = {}  # code object: frame label
+    names = {}  # thread ident: thread name
+    counts = {}
+    samples = 0
+    interval = 1 / hz
+    next_sample = time.monotonic()
+    deadline = next_sample + seconds
+    while True:
+        for ident, frame in sys._current_frames().items():
+            if ident in skip:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _frame_label(code, prefixes)
+                stack.append(label)
+                frame = frame.f_back
+            name = names.get(ident)
+            if name is None:
+                names.update((thread.ident, thread.name) for thread in threading.enumerate())
+                name = names.setdefault(ident, f"thread-{ident}")
+            stack.append(name)
+            folded = ';'.join(reversed(stack))
+            counts[folded] = counts.get(folded, 0) + 1
+        samples += 1
+        next_sample += interval
+        if next_sample >= deadline:
+            return counts, samples
+        delay = next_sample - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_sample = time.monotonic()  # Fell behind; skip the missed samples rather than rush them
+
+
+def init_profiler(app):
+    """
+    Profiles an app's requests as configured by PROFILE_KEY and PROFILE_SAMPLE_RATE, and
+    adds ``/debug/profile`` when PROFILE_KEY is set.
+
+    Call it before the other request hooks are added, so the profiles include them.
+
+    Args:
+        app (Flask): The application.
+    """
+    from services.ratelimit import rate_limit_exempt
+
+    key = app.config.get('PROFILE_KEY')
+    sample_rate = float(app.config.get('PROFILE_SAMPLE_RATE', 0))
+    if not key and not sample_rate:
+        return
+    if key:
+        hz = float(app.config.get('PROFILE_SAMPLE_HZ', 100))
+        max_seconds = float(app.config.get('PROFILE_MAX_SECONDS', 60))
+
+        @rate_limit_exempt
+        def debug_profile():
+            if not has_profile_key(key):
+                return jsonify({"error": "Invalid profile key."}), 403
+            seconds = request.args.get('seconds', 10, type=float)
+            if not 0 < seconds <= max_seconds:
+                return jsonify({"error": f"seconds must be above 0 and at most {max_seconds:g}."}), 400
+            if not _sampling.acquire(blocking=False):
+                return jsonify({"error": "A profile is already being taken in this worker."}), 409
+            try:
+                counts, samples = sample_stacks(seconds, hz, skip={threading.get_ident()})
+            finally:
+                _sampling.release()
+            folded = ''.join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+            return Response(folded, mimetype='text/plain', headers={'X-Profile-Samples': str(samples)})
+
+        app.add_url_rule('/debug/profile', 'debug_profile', debug_profile)
+
+    directory = app.config.get('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'ecommerce-profiles')
+    os.makedirs(directory, exist_ok=True)
+    keep = int(app.config.get('PROFILE_KEEP', 100))
+    top = int(app.config.get('PROFILE_TOP', 10))
+
+    def finish(endpoint):
+        # Stops this thread's profile, if any, and saves it
+        profile = getattr(_local, 'profile', None)
+        _local.profile = None
+        if profile is None:
+            return None, None
+        profiler, requested = profile
+        profiler.disable()
+        return profiler if requested else None, save_profile(profiler, directory, endpoint, keep)
+
+    @app.before_request
+    def start_profile():
+        requested = requested_profile(key)
+        if not requested and not (sample_rate and random.random() < sample_rate):
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return  # Another request is being profiled (Python 3.12+)
+        _local.profile = (profiler, requested)
+
+    @app.after_request
+    def finish_profile(response):
+        profiler, name = finish(request.endpoint)
+        if profiler is not None:
+            response.headers['X-Profile-File'] = name
+            response.headers['X-Profile-Summary'] = '; '.join(summarize(profiler, top))
+        return response
+
+    @app.teardown_request
+    def save_failed_profile(exc):
+        # after_request is skipped when the view raises; keep the profile of the failure
+        finish('failed')
@@ -0,0 +1,499 @@
+"""
+Rate limiting shared by all services.
+
+:func:`create_limiter` sets up Flask-Limiter for an app built by ``services.create_app``:
+
+- A request carrying a valid JWT (issued by ``customers.login``) is counted against
+  its identity, so clients behind one NAT address get a budget each; other requests
+  are counted against their address.
+- A view marked with :func:`rate_limit_cost` takes that many hits from its
+  blueprint's limit, so a password hash costs more than a lookup. Views marked with
+  :func:`rate_limit_exempt`, such as the health checks, are not limited.
+- RATELIMIT_STRATEGY=token-bucket selects :class:`TokenBucketRateLimiter`, which
+  allows bursts of up to the limit and refills evenly over its period.
+- Each process counts limiter decisions, the time spent making them, and rejections
+  per endpoint; :func:`rate_limit_status` reports them.
+
+Flask-Limiter's default ``memory://`` storage keeps its counters inside each
+process, so N Gunicorn workers let a client through N times the configured limit.
+:class:`MmapStorage` keeps them in a memory-mapped file instead, selected with:
+
+    RATELIMIT_STORAGE_URI=mmap:///dev/shm/ecommerce-ratelimit?buckets=16384
+    RATELIMIT_STRATEGY=sliding-window-counter
+
+The file is a fixed-size hash table: each key hashes to one bucket of eight slots,
+and a check reads and rewrites that single bucket while holding the bucket's lock,
+so it costs the same however many keys are stored and two workers never interleave
+an increment. A slot holds the key's fingerprint, the time its counts expire, and
+for the sliding window counter the current and previous window counts. When a
+bucket is full the slot that expires first is reused.
+
+The bucket locks are ``fcntl`` byte-range locks on the file, striped over the
+buckets, so every process that opens the file takes the same locks: Gunicorn's
+workers, a server being replaced during a reload, and ``flask`` maintenance commands
+run next to a live server. The kernel releases a process's locks when it dies, so a
+worker killed while holding one (by Gunicorn's timeout, say) does not block its
+stripe. Taking and releasing a lock costs two system calls, a couple of microseconds.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from math import floor
+from urllib.parse import urlparse, parse_qs
+from flask import current_app, request
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from flask_limiter import Limiter, RateLimitExceeded
+from flask_limiter.util import get_remote_address
+from jwt import PyJWTError
+from limits import WindowStats
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport
+from limits.strategies import STRATEGIES, RateLimiter
+from services.metrics import observe_cache
+
+MAGIC = b'RLMMAP01'
+HEADER = struct.Struct('<8sQ')  # magic, bucket count
+SLOTS_PER_BUCKET = 8
+# key fingerprint, expiry time, current count, previous window count; a token bucket
+# only uses the expiry time, as the time its bucket is full again
+SLOT = struct.Struct('<QdQQ')
+BUCKET_SIZE = SLOT.size * SLOTS_PER_BUCKET
+FINGERPRINTS = struct.Struct('<' + 'Q24x' * SLOTS_PER_BUCKET)
+EXPIRIES = struct.Struct('<' + '8xd16x' * SLOTS_PER_BUCKET)
+ENTRY = struct.Struct('<dQQ')
+DEFAULT_BUCKETS = 16384  # 4 MiB, room for over 100,000 live keys
+LOCKS = 64
+MAX_CACHED_KEYS = 65536
+
+_files = {}  # (device, inode) to the descriptor and stripe locks of each storage file open in this process
+_files_lock = threading.Lock()
+
+
+class _StripeLock:
+    """
+    One stripe of the bucket locks: a byte-range lock on one byte of the storage file,
+    behind a thread lock, since byte-range locks belong to the process and do not keep
+    its other threads out.
+    """
+    __slots__ = ('_fd', '_offset', '_thread_lock')
+
+    def __init__(self, fd, offset):
+        self._fd = fd
+        self._offset = offset
+        self._thread_lock = threading.Lock()
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, self._offset)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, self._offset)
+        self._thread_lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class MmapStorage(Storage, SlidingWindowCounterSupport):
+    """
+    Fixed window, sliding window counter and token bucket storage shared by the
+    processes using one file.
+    """
+
+    STORAGE_SCHEME = ['mmap']
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        parsed = urlparse(uri)
+        if not parsed.path:
+            raise ValueError(f"No file path in rate limit storage URI '{uri}'")
+        self.path = parsed.path
+        self.buckets = int(parse_qs(parsed.query).get('buckets', [DEFAULT_BUCKETS])[0])
+        self._keys = {}
+        self._open()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    def _open(self):
+        # Byte-range locks belong to the process, so storages on one file in a process
+        # share its descriptor and stripe locks, and the descriptor is never closed:
+        # closing any descriptor of the file would drop the process's locks on it
+        with _files_lock:
+            try:
+                stat = os.stat(self.path)
+                self._fd, self._locks = _files[(stat.st_dev, stat.st_ino)]
+            except (FileNotFoundError, KeyError):
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)  # Only while a new file is initialized
+                try:
+                    if os.fstat(self._fd).st_size == 0:
+                        os.ftruncate(self._fd, HEADER.size + self.buckets * BUCKET_SIZE)
+                        os.pwrite(self._fd, HEADER.pack(MAGIC, self.buckets), 0)
+                finally:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+                if os.pread(self._fd, len(MAGIC), 0) != MAGIC:
+                    os.close(self._fd)
+                    raise ValueError(f"{self.path} is not a rate limit storage file") from None
+                # Locks striped over the buckets, on the file's first LOCKS bytes
+                self._locks = [_StripeLock(self._fd, i) for i in range(LOCKS)]
+                stat = os.fstat(self._fd)
+                _files[(stat.st_dev, stat.st_ino)] = (self._fd, self._locks)
+        _, buckets = HEADER.unpack(os.pread(self._fd, HEADER.size, 0))
+        # Counters survive a restart, so keep the table size the file was created with
+        self.buckets = buckets
+        self._map = mmap.mmap(self._fd, HEADER.size + buckets * BUCKET_SIZE)
+
+    @property
+    def base_exceptions(self):
+        return OSError
+
+    def _slot(self, key):
+        # (fingerprint, bucket offset, lock); callers look in self._keys first, since
+        # clients repeat their keys and hashing costs more than the rest of a check
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        fingerprint = int.from_bytes(digest[:8], 'little') or 1
+        bucket = int.from_bytes(digest[8:], 'little') % self.buckets
+        slot = (fingerprint, HEADER.size + bucket * BUCKET_SIZE, self._locks[bucket % LOCKS])
+        if len(self._keys) >= MAX_CACHED_KEYS:
+            self._keys.clear()
+        self._keys[key] = slot
+        return slot
+
+    def _locate(self, offset, fingerprint):
+        # The key's slot in the bucket at offset and the slot's contents, or the slot to
+        # reuse for the key and zero counts
+        fingerprints = FINGERPRINTS.unpack_from(self._map, offset)
+        if fingerprint in fingerprints:
+            slot = offset + fingerprints.index(fingerprint) * SLOT.size
+            return (slot, *ENTRY.unpack_from(self._map, slot + 8))
+        expiries = EXPIRIES.unpack_from(self._map, offset)
+        return offset + expiries.index(min(expiries)) * SLOT.size, 0.0, 0, 0
+
+    def _sliding_window(self, expires_at, current, previous, expiry, now):
+        # A sliding window slot expires two windows after its current window started
+        window = now // expiry
+        stored = expires_at / expiry - 2
+        if stored == window - 1:
+            return window, 0, current
+        if stored != window:
+            return window, 0, 0
+        return window, current, previous
+
+    def incr(self, key, expiry, amount=1):
+        """
+        Increments a fixed window counter.
+
+        Args:
+            key (str): The rate limit key.
+            expiry (float): Seconds until a new counter expires.
+            amount (int): The amount to add.
+
+        Returns:
+            int: The new count.
+        """
+        fingerprint, offset, lock = self._keys.get(key) or self._slot(key)
+        lock.acquire()
+        try:
+            slot, expires_at, count, _ = self._locate(offset, fingerprint)
+            now = time.time()
+            if expires_at <= now:
+                expires_at, count = now + expiry, 0
+            SLOT.pack_into(self._map, slot, fingerprint, expires_at, count + amount, 0)
+            return count + amount
+        finally:
+            lock.release()
+
+    def get(self, key):
+        fingerprint, offset, _ = self._keys.get(key) or self._slot(key)
+        _, expires_at, count, _ = self._locate(offset, fingerprint)
+        return count if expires_at > time.time() else 0
+
+    def get_expiry(self, key):
+        fingerprint, offset, _ = self._keys.get(key) or self._slot(key)
+        _, expires_at, _, _ = self._locate(offset, fingerprint)
+        return max(expires_at, time.time())
+
+    def clear(self, key):
+        fingerprint, offset, lock = self._keys.get(key) or self._slot(key)
+        with lock:
+            fingerprints = FINGERPRINTS.unpack_from(self._map, offset)
+            if fingerprint in fingerprints:
+                SLOT.pack_into(self._map, offset + fingerprints.index(fingerprint) * SLOT.size, 0, 0.0, 0, 0)
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        fingerprint, offset, lock = self._keys.get(key) or self._slot(key)
+        # acquire() and release() rather than "with": they skip a Python-level wrapper
+        lock.acquire()
+        try:
+            slot, expires_at, current, previous = self._locate(offset, fingerprint)
+            now = time.time()
+            # Inlined _sliding_window: this is the check every limited request makes
+            window = now // expiry
+            stored = expires_at / expiry - 2
+            if stored != window:
+                current, previous = 0, current if stored == window - 1 else 0
+            if floor(previous * (1 - (now / expiry) % 1) + current) + amount > limit:
+                return False
+            SLOT.pack_into(self._map, slot, fingerprint, (window + 2) * expiry, current + amount, previous)
+            return True
+        finally:
+            lock.release()
+
+    def get_sliding_window(self, key, expiry):
+        fingerprint, offset, _ = self._keys.get(key) or self._slot(key)
+        now = time.time()
+        _, current, previous = self._sliding_window(*self._locate(offset, fingerprint)[1:], expiry, now)
+        remaining = (1 - (now / expiry) % 1) * expiry
+        return previous, remaining if previous else 0.0, current, remaining + expiry
+
+    def clear_sliding_window(self, key, expiry):
+        self.clear(key)
+
+    def acquire_token_bucket_entry(self, key, limit, expiry, amount=1):
+        """
+        Takes tokens from a bucket holding up to ``limit`` tokens and refilled with
+        ``limit`` tokens every ``expiry`` seconds.
+
+        The bucket is stored as the time it will be full again, which is all a bucket
+        refilled at a constant rate needs (the generic cell rate algorithm).
+
+        Args:
+            key (str): The rate limit key.
+            limit (int): The bucket's capacity.
+            expiry (int): Seconds to refill an empty bucket.
+            amount (int): The tokens to take.
+
+        Returns:
+            bool: Whether the bucket held enough tokens; none are taken if not.
+        """
+        fingerprint, offset, lock = self._keys.get(key) or self._slot(key)
+        lock.acquire()
+        try:
+            slot, full_at, _, _ = self._locate(offset, fingerprint)
+            now = time.time()
+            full_at = max(full_at, now) + amount * expiry / limit
+            if full_at - now > expiry:
+                return False
+            SLOT.pack_into(self._map, slot, fingerprint, full_at, 0, 0)
+            return True
+        finally:
+            lock.release()
+
+    def get_token_bucket(self, key, limit, expiry):
+        """
+        Returns:
+            tuple: The tokens left in the bucket and the time it will be full again.
+        """
+        fingerprint, offset, _ = self._keys.get(key) or self._slot(key)
+        _, full_at, _, _ = self._locate(offset, fingerprint)
+        now = time.time()
+        return floor((expiry - max(full_at - now, 0)) * limit / expiry), max(full_at, now)
+
+    def check(self):
+        return not self._map.closed
+
+    def reset(self):
+        # Stripes are taken in order, so two processes resetting at once cannot deadlock
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            now = time.time()
+            cleared = sum(1 for offset in range(HEADER.size, len(self._map), BUCKET_SIZE)
+                          for expires_at in EXPIRIES.unpack_from(self._map, offset) if expires_at > now)
+            self._map[HEADER.size:] = bytes(len(self._map) - HEADER.size)
+            return cleared
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
+
+
+class TokenBucketRateLimiter(RateLimiter):
+    """
+    Token bucket strategy: a limit of N per period holds up to N tokens, refilled at
+    N per period, and each hit takes ``cost`` tokens. Unlike a window it never allows
+    more than N hits in a burst at a window boundary, and a client that stays under
+    the rate is never limited. Needs a storage with token buckets, such as ``mmap://``.
+    """
+
+    def __init__(self, storage):
+        if not hasattr(storage, 'acquire_token_bucket_entry'):
+            raise NotImplementedError(f"Token buckets are not implemented for storage of type {type(storage)}")
+        super().__init__(storage)
+
+    def hit(self, item, *identifiers, cost=1):
+        return self.storage.acquire_token_bucket_entry(item.key_for(*identifiers), item.amount, item.get_expiry(),
+                                                       cost)
+
+    def test(self, item, *identifiers, cost=1):
+        tokens, _ = self.storage.get_token_bucket(item.key_for(*identifiers), item.amount, item.get_expiry())
+        return tokens >= cost
+
+    def get_window_stats(self, item, *identifiers):
+        tokens, full_at = self.storage.get_token_bucket(item.key_for(*identifiers), item.amount, item.get_expiry())
+        return WindowStats(full_at, tokens)
+
+
+STRATEGIES['token-bucket'] = TokenBucketRateLimiter
+
+
+def rate_limit_cost(weight):
+    """
+    Decorator setting how many hits a request to a view takes from its rate limit.
+
+    Args:
+        weight (int): The hits per request; views that are not marked take one.
+    """
+    def mark(view):
+        view.rate_limit_cost = weight
+        return view
+    return mark
+
+
+def rate_limit_exempt(view):
+    """
+    Decorator exempting a view from rate limits.
+    """
+    view.rate_limit_exempt = True
+    return view
+
+
+def request_cost():
+    """
+    Returns:
+        int: The hits the current request takes from its rate limit.
+    """
+    return getattr(current_app.view_functions.get(request.endpoint), 'rate_limit_cost', 1)
+
+
+def bearer_token(authorization):
+    """
+    Returns:
+        str: The token from an ``Authorization: Bearer <token>`` header value, or None.
+    """
+    scheme, _, token = (authorization or '').partition(' ')
+    return token if scheme.lower() == 'bearer' and token else None
+
+
+def token_identity(token):
+    """
+    Reads the identity from an encoded JWT, inside an app context.
+
+    Decoded tokens are cached until they expire, since a client sends the same token
+    with every request and decoding it costs more than the rest of a rate limit check.
+    The cache only chooses whose budget a request counts against; views that need a
+    token still verify it.
+
+    Returns:
+        str: The identity, or None if the token is not valid.
+    """
+    tokens = current_app.extensions['rate_limit_tokens']
+    cached = tokens.get(token)
+    hit = cached is not None and (cached[1] is None or cached[1] > time.time())
+    observe_cache('jwt_tokens', hit)
+    if not hit:
+        try:
+            decoded = decode_token(token)
+        except (JWTExtendedException, PyJWTError):
+            return None
+        if len(tokens) >= MAX_CACHED_KEYS:
+            tokens.clear()
+        cached = tokens[token] = (decoded[current_app.config['JWT_IDENTITY_CLAIM']], decoded.get('exp'))
+    return cached[0]
+
+
+def rate_limit_key():
+    """
+    Identifies the client of the current request for rate limiting.
+
+    Returns:
+        str: ``user:<identity>`` for a request with a valid JWT, else the client address.
+    """
+    token = bearer_token(request.headers.get('Authorization'))
+    identity = token_identity(token) if token else None
+    return f"user:{identity}" if identity is not None else get_remote_address()
+
+
+class RateLimitMetrics:
+    """
+    Counts one process's rate limit decisions, how long they took and which were
+    rejections.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.decision_seconds_total = 0.0
+        self.decision_seconds_max = 0.0
+        self.rejections = {}
+
+    def record(self, endpoint, seconds, rejected):
+        with self._lock:
+            self.checks += 1
+            self.decision_seconds_total += seconds
+            self.decision_seconds_max = max(self.decision_seconds_max, seconds)
+            if rejected:
+                self.rejections[endpoint] = self.rejections.get(endpoint, 0) + 1
+
+    def status(self):
+        with self._lock:
+            return {
+                'checks': self.checks,
+                'decision_seconds_total': round(self.decision_seconds_total, 6),
+                'decision_seconds_max': round(self.decision_seconds_max, 6),
+                'rejections': dict(self.rejections),
+            }
+
+
+def create_limiter(app):
+    """
+    Sets up rate limiting for an app, as described at the top of this module.
+
+    Args:
+        app (Flask): The application, configured with its RATELIMIT_* settings.
+
+    Returns:
+        Limiter: The limiter, to apply limits to the app's blueprints with
+            ``cost=request_cost``.
+    """
+    limiter = Limiter(rate_limit_key, app=app, auto_check=False)
+    metrics = app.extensions['rate_limit_metrics'] = RateLimitMetrics()
+    app.extensions['rate_limit_tokens'] = {}
+
+    @app.before_request
+    def check_rate_limits():
+        # Replaces Flask-Limiter's own check (auto_check=False) so it can be timed
+        view = app.view_functions.get(request.endpoint)
+        if not limiter.enabled or view is None or getattr(view, 'rate_limit_exempt', False):
+            return
+        start = time.perf_counter()
+        rejected = False
+        try:
+            limiter.check()
+        except RateLimitExceeded:
+            rejected = True
+            raise
+        finally:
+            metrics.record(request.endpoint, time.perf_counter() - start, rejected)
+
+    return limiter
+
+
+def rate_limit_status():
+    """
+    Reports the current app's rate limit decisions in this process.
+
+    Returns:
+        dict: Decisions made, time spent making them, and rejections per endpoint.
+    """
+    return current_app.extensions['rate_limit_metrics'].status()
@@ -0,0 +1,332 @@
+"""
+Automated screening of pending reviews.
+
+Runs as a background worker next to the Reviews service::
+
+    python -m services.reviews.screening
+
+Submitting or editing a review queues it for screening in the same transaction
+(:func:`queue_screening`). The worker pulls the queue in batches and scores each
+pending review against a configurable blocklist (matched in a single pass with an
+Aho-Corasick automaton) plus a few cheap heuristics: shouting, links and repetition.
+Clean reviews are approved, bad ones are flagged, and anything in between is left
+pending for a human moderator, scored again only if it is edited.
+
+The worker also adds newly submitted and edited reviews to the search index, which
+the request handlers only queue (see services/reviews/search.py).
+
+Configuration (environment):
+    REVIEW_BLOCKLIST: Comma-separated blocklist terms, replacing the defaults.
+    REVIEW_BLOCKLIST_FILE: File with one blocklist term per line, replacing the defaults.
+    SCREENING_BATCH_SIZE: Reviews fetched per batch (default 500).
+    SCREENING_INTERVAL: Seconds to sleep once the queue is drained (default 10).
+"""
+import logging
+import os
+import re
+import time
+from collections import deque
+from database.database import db, insert_ignore, Review, ReviewScreeningQueue, apply_item_rating_batch
+from services.reviews.search import index_queued_reviews
+
+DEFAULT_BLOCKLIST = [
+    'viagra', 'casino', 'free money', 'click here', 'buy followers', 'crypto giveaway',
+    'work from home', 'whatsapp me', 'promo code', 'earn $$$',
+]
+LINK_PATTERN = re.compile(r'https?://|www\.', re.IGNORECASE)
+RUN_PATTERN = re.compile(r'(.)\1{5,}')
+
+logger = logging.getLogger(__name__)
+
+
+class AhoCorasick:
+    """
+    Multi-pattern matcher that finds every blocklist term in one pass over the text.
+
+    Matching is case-insensitive and only reports whole-word hits, so 'scam' does not
+    fire on 'scampi'.
+
+    Args:
+        patterns (iterable): The terms to match.
+    """
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for pattern in patterns:
+            pattern = pattern.strip().lower()
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state] += (pattern,)
+
+        # Breadth-first pass to wire failure links and merge outputs of suffix states
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] += self.output[self.fail[child]]
+
+    def search(self, text):
+        """
+        Finds the blocklist terms occurring in a text.
+
+        Args:
+            text (str): The text to scan.
+
+        Returns:
+            set: The matched terms.
+        """
+        text = text.lower()
+        goto, fail, output = self.goto, self.fail, self.output
+        matches = set()
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern in output[state]:
+                start = end - len(pattern) + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end + 1 == len(text) or not text[end + 1].isalnum()):
+                    matches.add(pattern)
+        return matches
+
+
+class ReviewScreener:
+    """
+    Scores review comments and decides whether they can skip human moderation.
+
+    Args:
+        blocklist (iterable): Terms that flag a review outright.
+        flag_threshold (float): Scores at or above this are flagged.
+        approve_threshold (float): Scores at or below this are approved.
+    """
+
+    def __init__(self, blocklist=DEFAULT_BLOCKLIST, flag_threshold=0.8, approve_threshold=0.2):
+        self.matcher = AhoCorasick(blocklist)
+        self.flag_threshold = flag_threshold
+        self.approve_threshold = approve_threshold
+
+    def score(self, comment):
+        """
+        Scores a comment between 0 (clean) and 1 (abusive or spam).
+
+        Args:
+            comment (str): The review comment.
+
+        Returns:
+            tuple: The score and a list of reasons that contributed to it.
+        """
+        if not comment:
+            return 0.0, []
+        reasons = []
+        score = 0.0
+
+        blocked = self.matcher.search(comment)
+        if blocked:
+            score += 1.0
+            reasons.append(f"blocklist: {', '.join(sorted(blocked))}")
+
+        links = len(LINK_PATTERN.findall(comment))
+        if links:
+            score += 0.5 * links
+            reasons.append(f"links: {links}")
+
+        letters = [c for c in comment if c.isalpha()]
+        if len(letters) >= 12 and sum(c.isupper() for c in letters) / len(letters) > 0.7:
+            score += 0.4
+            reasons.append("caps")
+
+        if RUN_PATTERN.search(comment):
+            score += 0.3
+            reasons.append("repeated characters")
+
+        words = comment.lower().split()
+        if len(words) >= 8 and len(set(words)) / len(words) < 0.3:
+            score += 0.4
+            reasons.append("repeated words")
+
+        return min(score, 1.0), reasons
+
+    def classify(self, comment):
+        """
+        Decides the new status of a pending review.
+
+        Args:
+            comment (str): The review comment.
+
+        Returns:
+            str: 'approved', 'flagged', or None to leave the review for a moderator.
+        """
+        score, _ = self.score(comment)
+        if score >= self.flag_threshold:
+            return 'flagged'
+        if score <= self.approve_threshold:
+            return 'approved'
+        return None
+
+
+def load_blocklist():
+    """
+    Loads the blocklist from the environment, falling back to DEFAULT_BLOCKLIST.
+
+    Returns:
+        list: The blocklist terms.
+    """
+    if os.environ.get('REVIEW_BLOCKLIST_FILE'):
+        with open(os.environ['REVIEW_BLOCKLIST_FILE'], encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    if os.environ.get('REVIEW_BLOCKLIST'):
+        return [term for term in os.environ['REVIEW_BLOCKLIST'].split(',') if term.strip()]
+    return DEFAULT_BLOCKLIST
+
+
+def queue_screening(review_id):
+    """
+    Queues a pending review for the screening worker.
+
+    The row joins the caller's transaction; queueing a review twice is a no-op.
+
+    Args:
+        review_id (int): The ID of the review.
+    """
+    insert_ignore(ReviewScreeningQueue, [{'review_id': review_id}])
+
+
+def queue_pending_reviews(batch_size=10000):
+    """
+    Queues every pending review for screening and commits.
+
+    Run when the worker starts, so reviews that were pending before the queue existed
+    are screened, and those left for a moderator get one more pass under the current
+    blocklist.
+
+    Args:
+        batch_size (int): Number of review IDs read and queued per statement.
+
+    Returns:
+        int: The number of pending reviews.
+    """
+    total, last_id = 0, 0
+    while True:
+        ids = db.session.execute(
+            db.select(Review.id).where(Review.status == 'pending', Review.id > last_id)
+            .order_by(Review.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        insert_ignore(ReviewScreeningQueue, [{'review_id': review_id} for review_id in ids])
+        db.session.commit()
+        total += len(ids)
+        last_id = ids[-1]
+    return total
+
+
+def screen_pending_reviews(screener, batch_size=500):
+    """
+    Screens one batch of queued reviews and commits the resulting status changes.
+
+    Queue rows are locked with SKIP LOCKED so several workers can drain the queue side
+    by side; a row skipped because another worker holds it stays queued until that
+    worker removes it. Queued reviews that are no longer pending, because a moderator
+    got to them first, are dropped. Auto-approved reviews are added to the item rating
+    summaries in the same transaction.
+
+    Args:
+        screener (ReviewScreener): The scorer to apply.
+        batch_size (int): Maximum number of reviews to take off the queue.
+
+    Returns:
+        dict: Counts of reviews taken off the queue, and of screened, approved and
+            flagged reviews.
+    """
+    queued = db.session.execute(
+        db.select(ReviewScreeningQueue.review_id)
+        .order_by(ReviewScreeningQueue.review_id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    rows = []
+    if queued:
+        rows = db.session.execute(
+            db.select(Review.id, Review.item_id, Review.rating, Review.sentiment, Review.comment)
+            .where(Review.id.in_(queued), Review.status == 'pending')
+            .order_by(Review.id)
+            .with_for_update()
+        ).all()
+
+    decisions = {'approved': [], 'flagged': []}
+    for row in rows:
+        status = screener.classify(row.comment)
+        if status:
+            decisions[status].append(row)
+
+    for status, decided in decisions.items():
+        if decided:
+            db.session.execute(
+                db.update(Review).where(Review.id.in_([row.id for row in decided])).values(status=status)
+                .execution_options(synchronize_session=False)
+            )
+    apply_item_rating_batch([], [(row.item_id, row.rating, row.sentiment) for row in decisions['approved']])
+    if queued:
+        db.session.execute(db.delete(ReviewScreeningQueue).where(ReviewScreeningQueue.review_id.in_(queued)))
+    db.session.commit()
+
+    return {
+        'dequeued': len(queued),
+        'screened': len(rows),
+        'approved': len(decisions['approved']),
+        'flagged': len(decisions['flagged']),
+    }
+
+
+def run_worker(app, screener, batch_size=500, interval=10):
+    """
+    Drains the screening and search index queues forever, sleeping once a pass finds
+    neither full.
+
+    On start every pending review is queued once (see ``queue_pending_reviews``).
+
+    Args:
+        app (Flask): The application providing the database configuration.
+        screener (ReviewScreener): The scorer to apply.
+        batch_size (int): Reviews taken off each queue per batch.
+        interval (float): Seconds to sleep between passes over the queues.
+    """
+    with app.app_context():
+        queue_pending_reviews()
+        while True:
+            start = time.perf_counter()
+            result = screen_pending_reviews(screener, batch_size)
+            if result['screened']:
+                elapsed = time.perf_counter() - start
+                logger.info("Screened %d reviews (%d approved, %d flagged) in %.3fs", result['screened'],
+                            result['approved'], result['flagged'], elapsed)
+            indexed = index_queued_reviews(batch_size)
+            if result['dequeued'] < batch_size and indexed < batch_size:
+                time.sleep(interval)
+
+
+if __name__ == '__main__':
+    from services import create_app
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    run_worker(
+        create_app(services=['reviews']),
+        ReviewScreener(load_blocklist()),
+        batch_size=int(os.environ.get('SCREENING_BATCH_SIZE', 500)),
+        interval=float(os.environ.get('SCREENING_INTERVAL', 10)),
+    )
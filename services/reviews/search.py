@@ -0,0 +1,348 @@
+"""
+Full-text search over review comments.
+
+The inverted index lives in the ``review_posting`` table so every worker and service
+instance shares it. Posting lists are split into blocks of at most BLOCK_SIZE review
+IDs; each block is sorted, delta-encoded and packed as LEB128 varints, which keeps a
+typical posting to one or two bytes.
+
+Submitting or editing a review only queues it (:func:`queue_review`); the screening
+worker adds queued reviews to the index in batches (:func:`index_queued_reviews`),
+so a new review becomes searchable within SCREENING_INTERVAL seconds.
+"""
+import re
+from database.database import db, insert_ignore, Review, ReviewIndexQueue, ReviewPosting
+
+BLOCK_SIZE = 256
+DECODE_LIMIT = 50000
+CHUNK_SIZE = 1000
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its my of on or so that the "
+    "this to was were will with you your".split()
+)
+
+
+def tokenize(text):
+    """
+    Splits text into lowercase index terms, dropping stopwords and single characters.
+
+    Args:
+        text (str): The text to tokenize.
+
+    Returns:
+        list: The terms in order of appearance.
+    """
+    return [token[:64] for token in TOKEN_PATTERN.findall((text or '').lower())
+            if len(token) > 1 and token not in STOPWORDS]
+
+
+def encode_postings(ids):
+    """
+    Packs sorted review IDs as delta-encoded varints.
+
+    Args:
+        ids (list): Sorted, distinct review IDs.
+
+    Returns:
+        bytes: The compressed posting block.
+    """
+    out = bytearray()
+    previous = 0
+    for review_id in ids:
+        delta = review_id - previous
+        previous = review_id
+        while delta >= 0x80:
+            out.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+
+def decode_postings(data):
+    """
+    Unpacks a posting block produced by ``encode_postings``.
+
+    Args:
+        data (bytes): The compressed posting block.
+
+    Returns:
+        list: The sorted review IDs.
+    """
+    ids = []
+    value = shift = previous = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += value
+        ids.append(previous)
+        value = shift = 0
+    return ids
+
+
+def queue_review(review_id):
+    """
+    Queues a review to have its comment indexed by ``index_queued_reviews``.
+
+    The row joins the caller's transaction; queueing a review twice is a no-op.
+
+    Args:
+        review_id (int): The ID of the review.
+    """
+    insert_ignore(ReviewIndexQueue, [{'review_id': review_id}])
+
+
+def add_postings(additions):
+    """
+    Adds review IDs to the index.
+
+    Each term's block 0 is created first by an insert that skips existing rows, so
+    writers adding the same new term at once never collide on its primary key. Then
+    only the last block of each term is locked, read and rewritten, with further
+    blocks added once it is full, so the cost is bounded by the number of terms, not
+    by the size of the index. Rows are locked in term order so that concurrent writers
+    cannot deadlock. The changes join the caller's transaction.
+
+    Args:
+        additions (dict): Term to the review IDs to add to its posting list.
+    """
+    if not additions:
+        return
+    insert_ignore(ReviewPosting, [{'term': term, 'block': 0, 'count': 0, 'max_id': 0, 'postings': b''}
+                                   for term in sorted(additions)])
+    last_blocks = (
+        db.select(ReviewPosting.term, db.func.max(ReviewPosting.block).label('block'))
+        .where(ReviewPosting.term.in_(additions))
+        .group_by(ReviewPosting.term)
+        .subquery()
+    )
+    tails = db.session.execute(
+        db.select(ReviewPosting)
+        .join(last_blocks, db.and_(ReviewPosting.term == last_blocks.c.term,
+                                   ReviewPosting.block == last_blocks.c.block))
+        .order_by(ReviewPosting.term)
+        .with_for_update()
+    ).scalars().all()
+
+    for tail in tails:
+        ids = decode_postings(tail.postings)
+        new = sorted(set(additions[tail.term]).difference(ids))
+        if not new:
+            continue
+        if len(ids) < BLOCK_SIZE:
+            room = BLOCK_SIZE - len(ids)
+            ids = sorted(ids + new[:room])
+            new = new[room:]
+            tail.postings = encode_postings(ids)
+            tail.count = len(ids)
+            tail.max_id = ids[-1]
+        for i, start in enumerate(range(0, len(new), BLOCK_SIZE)):
+            chunk = new[start:start + BLOCK_SIZE]
+            db.session.add(ReviewPosting(term=tail.term, block=tail.block + 1 + i, count=len(chunk),
+                                         max_id=chunk[-1], postings=encode_postings(chunk)))
+
+
+def index_queued_reviews(batch_size=500):
+    """
+    Indexes one batch of queued reviews and commits.
+
+    Queue rows are locked with SKIP LOCKED so several workers can drain the queue side
+    by side. The batch's terms are merged into the index together, so a common word's
+    last block is locked and rewritten once per batch rather than once per review.
+
+    Args:
+        batch_size (int): Maximum number of reviews to index.
+
+    Returns:
+        int: The number of reviews taken off the queue.
+    """
+    queued = db.session.execute(
+        db.select(ReviewIndexQueue.review_id)
+        .order_by(ReviewIndexQueue.review_id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not queued:
+        db.session.commit()
+        return 0
+
+    additions = {}
+    rows = db.session.execute(
+        db.select(Review.id, Review.comment).where(Review.id.in_(queued), Review.status != 'deleted')
+    ).all()
+    for review_id, comment in rows:
+        for term in set(tokenize(comment)):
+            additions.setdefault(term, []).append(review_id)
+    add_postings(additions)
+    db.session.execute(db.delete(ReviewIndexQueue).where(ReviewIndexQueue.review_id.in_(queued)))
+    db.session.commit()
+    return len(queued)
+
+
+def load_postings(term):
+    """
+    Decodes every block of a term's posting list.
+
+    Args:
+        term (str): The index term.
+
+    Returns:
+        set: The review IDs containing the term.
+    """
+    ids = set()
+    for data in db.session.execute(db.select(ReviewPosting.postings).where(ReviewPosting.term == term)).scalars():
+        ids.update(decode_postings(data))
+    return ids
+
+
+def _verify(ids, terms, accept, remaining):
+    """
+    Loads candidate reviews newest first and keeps those that still match.
+
+    Candidates are fetched by primary key only and filtered here, so the database
+    never trades the ID lookup for a scan of a low-cardinality status index.
+    """
+    matches = []
+    # Small first chunks: for common words the first few candidates usually suffice
+    chunk = min(CHUNK_SIZE, 2 * remaining)
+    i = 0
+    while i < len(ids):
+        rows = db.session.execute(
+            db.select(Review).where(Review.id.in_(ids[i:i + chunk])).order_by(Review.id.desc())
+        ).scalars()
+        i += chunk
+        chunk = min(chunk * 2, CHUNK_SIZE)
+        for review in rows:
+            if accept(review) and terms.issubset(tokenize(review.comment)):
+                matches.append(review)
+                if len(matches) == remaining:
+                    return matches
+    return matches
+
+
+def search_reviews(query, item_id=None, status=None, rating=None, limit=50):
+    """
+    Finds live reviews whose comment contains every term of the query.
+
+    The rarest term drives the search: its blocks are read in descending ``max_id``
+    order, a few at a time, and the other terms' posting lists are decoded up front
+    only when they are small enough to be cheap filters. Candidates that no unread
+    block can outrank are loaded newest first with the status, rating and item
+    filters applied, and each comment is re-tokenized to confirm the match, which
+    also drops postings left behind by edits. The search stops as soon as ``limit``
+    results are found, so a common word costs about as much as a rare one.
+
+    Args:
+        query (str): The search text.
+        item_id (int): Restrict to one item.
+        status (str): Restrict to one review status.
+        rating (int): Restrict to one rating.
+        limit (int): Maximum number of results.
+
+    Returns:
+        list: Matching reviews, newest first.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+    sizes = dict(db.session.execute(
+        db.select(ReviewPosting.term, db.func.sum(ReviewPosting.count))
+        .where(ReviewPosting.term.in_(terms))
+        .group_by(ReviewPosting.term)
+    ).all())
+    if len(sizes) < len(terms):
+        return []
+
+    driver, *others = sorted(terms, key=sizes.get)
+    required = [load_postings(term) for term in others if sizes[term] <= DECODE_LIMIT]
+
+    def accept(review):
+        return (review.status != 'deleted'
+                and (item_id is None or review.item_id == item_id)
+                and (not status or review.status == status)
+                and (rating is None or review.rating == rating))
+
+    results, pool, seen = [], set(), set()
+    after, page_size = None, 1
+    while True:
+        stmt = db.select(ReviewPosting.max_id, ReviewPosting.block, ReviewPosting.postings).where(
+            ReviewPosting.term == driver)
+        if after:
+            stmt = stmt.where(db.tuple_(ReviewPosting.max_id, ReviewPosting.block) < after)
+        page = db.session.execute(
+            stmt.order_by(ReviewPosting.max_id.desc(), ReviewPosting.block.desc()).limit(page_size + 1)
+        ).all()
+        more = len(page) > page_size
+        for row in page[:page_size]:
+            pool.update(decode_postings(row.postings))
+        pool -= seen
+
+        # No unread block holds an ID above its max_id, so everything above it is final
+        bound = page[page_size].max_id if more else 0
+        ready = sorted((review_id for review_id in pool if review_id > bound), reverse=True)
+        pool.difference_update(ready)
+        seen.update(ready)
+        ready = [review_id for review_id in ready if all(review_id in ids for ids in required)]
+        results += _verify(ready, terms, accept, limit - len(results))
+
+        if len(results) >= limit or not more:
+            return results
+        after = (page[page_size - 1].max_id, page[page_size - 1].block)
+        page_size = min(page_size * 2, 1024)
+
+
+def rebuild_search_index(batch_size=10000, flush_every=500000):
+    """
+    Rebuilds the inverted index from scratch, dropping stale postings.
+
+    Reviews are read in ID order and the in-memory index is written out every
+    ``flush_every`` reviews, continuing each term's block numbering, so memory stays
+    bounded on large tables.
+
+    Args:
+        batch_size (int): Number of reviews read per batch.
+        flush_every (int): Number of reviews indexed in memory before writing blocks.
+
+    Returns:
+        int: The number of distinct terms indexed.
+    """
+    next_block = {}
+
+    def flush(index):
+        for term, ids in index.items():
+            block = next_block.get(term, 0)
+            db.session.add_all(
+                ReviewPosting(term=term, block=block + i, count=len(ids[start:start + BLOCK_SIZE]),
+                              max_id=ids[min(start + BLOCK_SIZE, len(ids)) - 1],
+                              postings=encode_postings(ids[start:start + BLOCK_SIZE]))
+                for i, start in enumerate(range(0, len(ids), BLOCK_SIZE))
+            )
+            next_block[term] = block + (len(ids) + BLOCK_SIZE - 1) // BLOCK_SIZE
+        db.session.flush()
+        db.session.expunge_all()
+
+    db.session.execute(db.delete(ReviewPosting))
+    index, pending, last_id = {}, 0, 0
+    while True:
+        # Keyset batches rather than a streaming cursor, so blocks can be written between reads
+        rows = db.session.execute(
+            db.select(Review.id, Review.comment)
+            .where(Review.id > last_id, Review.status != 'deleted')
+            .order_by(Review.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        for review_id, comment in rows:
+            for term in set(tokenize(comment)):
+                index.setdefault(term, []).append(review_id)
+        pending += len(rows)
+        last_id = rows[-1].id
+        if pending >= flush_every:
+            flush(index)
+            index, pending = {}, 0
+    flush(index)
+    db.session.commit()
+    return len(next_block)
@@ -0,0 +1,138 @@
+"""
+Lexicon-based sentiment scoring of review comments.
+
+Comments are tokenized with the search tokenizer, each token is looked up in a
+sentiment lexicon (a word preceded by a negator such as 'not' counts with the
+opposite sign), and the summed weights are squashed into a score between -1 and 1.
+
+Single comments are scored in plain Python when they are submitted. The batch job
+maps whole batches of comments to one flat array of token IDs and scores them with
+vectorized NumPy operations (NumPy is in requirements.txt); where it is not
+installed the batch job falls back to the plain Python scorer, which gives the same
+scores at roughly half the speed.
+
+Set SENTIMENT_LEXICON_FILE to a file of 'word<TAB>weight' lines to replace the
+built-in lexicon.
+"""
+import math
+import os
+from itertools import repeat
+from services.reviews.search import tokenize, STOPWORDS
+
+DEFAULT_LEXICON = {
+    'amazing': 3, 'awesome': 3, 'excellent': 3, 'fantastic': 3, 'love': 3, 'loved': 3, 'perfect': 3,
+    'outstanding': 3, 'superb': 3, 'wonderful': 3, 'best': 3,
+    'great': 2, 'good': 2, 'happy': 2, 'nice': 2, 'recommend': 2, 'recommended': 2, 'reliable': 2,
+    'sturdy': 2, 'fast': 1, 'solid': 1, 'works': 1, 'comfortable': 2, 'pleased': 2, 'satisfied': 2,
+    'fine': 1, 'decent': 1, 'ok': 1, 'okay': 1, 'cheap': -1,
+    'awful': -3, 'terrible': -3, 'horrible': -3, 'worst': -3, 'hate': -3, 'hated': -3, 'useless': -3,
+    'garbage': -3, 'scam': -3, 'junk': -3,
+    'bad': -2, 'poor': -2, 'broken': -2, 'broke': -2, 'disappointed': -2, 'disappointing': -2,
+    'defective': -2, 'faulty': -2, 'refund': -2, 'waste': -2, 'returned': -2, 'cracked': -2,
+    'overheats': -2, 'slow': -1, 'flimsy': -2, 'noisy': -1, 'died': -2, 'fails': -2, 'failed': -2,
+}
+NEGATORS = frozenset(['not', 'no', 'never', 'isn', 'wasn', 'don', 'doesn', 'didn', 'hardly', 'without'])
+ALPHA = 15  # Squashing constant: score = total / sqrt(total**2 + ALPHA)
+BATCH_TOKEN_BYTES = b'abcdefghijklmnopqrstuvwxyz0123456789'
+BATCH_TRANSLATE = bytes(c if c in BATCH_TOKEN_BYTES + b'\x01' else 32 for c in range(256))
+
+
+def load_lexicon():
+    """
+    Loads the lexicon from SENTIMENT_LEXICON_FILE, falling back to DEFAULT_LEXICON.
+
+    Returns:
+        dict: Word weights.
+    """
+    path = os.environ.get('SENTIMENT_LEXICON_FILE')
+    if not path:
+        return DEFAULT_LEXICON
+    lexicon = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                word, weight = line.rsplit('\t', 1)
+                lexicon[word.strip().lower()] = float(weight)
+    return lexicon
+
+
+class SentimentScorer:
+    """
+    Scores comments against a sentiment lexicon.
+
+    Args:
+        lexicon (dict): Word weights, typically between -3 and 3.
+    """
+
+    def __init__(self, lexicon=None):
+        self.lexicon = lexicon or load_lexicon()
+        # Token IDs: 0 for unknown words, then lexicon words, then negators (weight 0)
+        self.vocabulary = {word: i for i, word in enumerate(self.lexicon, start=1)}
+        for word in NEGATORS:
+            self.vocabulary.setdefault(word, len(self.vocabulary) + 1)
+        self.weights = [0.0] * (len(self.vocabulary) + 1)
+        for word, i in self.vocabulary.items():
+            self.weights[i] = float(self.lexicon.get(word, 0.0))
+        self.negator_ids = sorted(self.vocabulary[word] for word in NEGATORS)
+        # Token codes for score_batch: stopwords and single characters are dropped like tokenize does
+        self.batch_lookup = {word.encode(): -1 for word in STOPWORDS}
+        self.batch_lookup.update({bytes([c]): -1 for c in BATCH_TOKEN_BYTES})
+        self.batch_lookup.update({word.encode(): i for word, i in self.vocabulary.items()
+                                  if len(word) > 1 and word not in STOPWORDS})
+        self.batch_lookup[b'\x01'] = -2
+
+    def score(self, comment):
+        """
+        Scores a single comment.
+
+        Args:
+            comment (str): The review comment.
+
+        Returns:
+            float: The sentiment between -1 (negative) and 1 (positive).
+        """
+        total = 0.0
+        negated = False
+        for token in tokenize(comment):
+            weight = self.lexicon.get(token, 0.0)
+            total += -weight if negated else weight
+            negated = token in NEGATORS
+        return total / math.sqrt(total * total + ALPHA)
+
+    def score_batch(self, comments):
+        """
+        Scores many comments at once with vectorized NumPy operations.
+
+        Args:
+            comments (list): The review comments.
+
+        Returns:
+            list: One sentiment per comment, in order.
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            return [self.score(comment) for comment in comments]
+        if not comments:
+            return []
+
+        # Tokenize the whole batch in one pass: the token pattern is ASCII-only, so a byte
+        # translate table that blanks everything else plus split() matches it, with \x01
+        # marking comment boundaries. Each token is then mapped to an ID with a single dict
+        # lookup (-1 for dropped tokens, -2 for boundaries); the rest is array arithmetic.
+        joined = '\x01'.join((comment or '').replace('\x01', ' ') for comment in comments).lower()
+        tokens = joined.encode('utf-8', 'surrogatepass').translate(BATCH_TRANSLATE).replace(b'\x01', b' \x01 ').split()
+        codes = np.fromiter(map(self.batch_lookup.get, tokens, repeat(0)), dtype=np.int64, count=len(tokens))
+        boundary = codes == -2
+        kept = codes >= 0
+        owner = np.cumsum(boundary)[kept]
+        ids = codes[kept]
+
+        # A token is negated when the previous kept token of the same comment is a negator
+        is_negator = np.isin(ids, self.negator_ids)
+        negated = np.zeros(len(ids), dtype=bool)
+        negated[1:] = is_negator[:-1] & (owner[1:] == owner[:-1])
+
+        values = np.asarray(self.weights)[ids] * np.where(negated, -1.0, 1.0)
+        totals = np.bincount(owner, weights=values, minlength=len(comments))
+        return (totals / np.sqrt(totals * totals + ALPHA)).tolist()
@@ -0,0 +1,81 @@
+"""
+JSON encoding for every response of the apps built with ``services.create_app``.
+
+:class:`FastJSONProvider` replaces Flask's standard library encoder with orjson when
+it is installed, so ``jsonify`` costs a fraction of what it did on list routes such
+as ``get_items``. Without orjson it falls back to Flask's encoder. Either way,
+datetimes are written natively in ISO 8601 to the second (``2024-05-01T12:30:00``),
+and dates as ``2024-05-01``, so views pass them through without formatting them.
+
+Keys are written in the order the view builds them, rather than sorted as Flask does
+by default. Views build their dicts in a fixed order, so a response is still the same
+bytes every time. Non-string keys, such as the star ratings of a rating histogram, are
+written as strings, as the standard library does.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+else:
+    OPTIONS = orjson.OPT_OMIT_MICROSECONDS | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value):
+    # Types orjson does not encode itself, handled as Flask's encoder handles them
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _stdlib_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat(timespec='seconds')
+    if isinstance(value, date):
+        return value.isoformat()
+    return DefaultJSONProvider.default(value)
+
+
+def to_json(obj):
+    """
+    Encodes a value as compact JSON, the way responses encode it.
+
+    Args:
+        obj: The value.
+
+    Returns:
+        bytes: The UTF-8 encoded JSON.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=OPTIONS)
+    return json.dumps(obj, default=_stdlib_default, separators=(',', ':')).encode()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that encodes with orjson when it is installed.
+    """
+    sort_keys = False
+    default = staticmethod(_stdlib_default)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is None or self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(obj)  # Flask's indented output, for debugging
+        return self._app.response_class(to_json(obj), mimetype=self.mimetype)
@@ -3,3 +3,16 @@ import os
 
 # Add the project root directory to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    """
+    Starts every test with fresh rate limit counters, since the tests share one app
+    and one client address.
+    """
+    from app import app
+    for limiter in app.extensions.get('limiter', ()):
+        limiter.reset()
@@ -0,0 +1,513 @@
+import os
+import subprocess
+import sys
+import pytest
+from services import create_app
+
+
+def test_create_app_registers_requested_services():
+    """
+    Test that the factory only registers the services it is asked for.
+    """
+    app = create_app(['customers'], config={'SQLALCHEMY_DATABASE_URI': "sqlite:///:memory:"})
+    assert set(app.blueprints) == {'customers'}
+    assert 'flask-jwt-extended' in app.extensions
+    assert len(app.extensions['limiter']) == 1
+
+    with pytest.raises(ValueError):
+        create_app(['customers', 'shipping'])
+
+
+def test_create_app_database_uri(tmp_path, monkeypatch):
+    """
+    Test that an explicit database URI wins over the environment, which wins over the default.
+    """
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'env.db'}")
+    app = create_app(['customers'], config={'SQLALCHEMY_DATABASE_URI': "sqlite:///:memory:"})
+    assert app.config['SQLALCHEMY_DATABASE_URI'] == "sqlite:///:memory:"
+    app = create_app(['customers'])
+    assert app.config['SQLALCHEMY_DATABASE_URI'] == f"sqlite:///{tmp_path / 'env.db'}"
+
+
+def test_create_app_imports_lazily():
+    """
+    Test that building a single-service app does not import the other services.
+    """
+    code = (
+        "import sys\n"
+        "from services import create_app\n"
+        "create_app(['customers'], config={'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})\n"
+        "print(sorted(name for name in sys.modules if name.startswith('services.')))\n"
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.join(os.path.dirname(__file__), '..'))
+    assert result.stdout.strip() == ("['services.compression', 'services.conditional', 'services.customers', "
+                                     "'services.customers.customers', 'services.memory', 'services.metrics', "
+                                     "'services.profiler', 'services.ratelimit', 'services.serialization']")
+
+
+def test_asgi_read_path_matches_flask(tmp_path, monkeypatch):
+    """
+    Test that the async read routes return what the Flask routes return.
+    """
+    import asyncio
+    import json
+    from database.database import db, InventoryItem
+    from services.asgi import create_asgi_app
+
+    monkeypatch.delenv('SQLALCHEMY_DATABASE_URI', raising=False)
+    app = create_asgi_app(['inventory', 'sales'], config={
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'asgi.db'}",
+        'RATELIMIT_ENABLED': False,
+    })
+    flask_app = app.state.flask_app
+    with flask_app.app_context():
+        db.create_all()
+        db.session.add(InventoryItem(name="Laptop", category="Electronics", price=999.99, stock=10))
+        db.session.add(InventoryItem(name="Phone", category="Electronics", price=499.99, stock=0))
+        db.session.commit()
+
+    async def get(path):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        await app({'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http', 'path': path,
+                   'raw_path': path.encode(), 'query_string': b'', 'root_path': '', 'headers': [],
+                   'client': ('127.0.0.1', 1234), 'server': ('localhost', 80)}, receive, send)
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        return messages[0]['status'], json.loads(body)
+
+    async def run():
+        async with app.router.lifespan_context(app):
+            return [await get(path) for path in ('/inventory/get_item/Laptop', '/inventory/get_item/Tablet',
+                                                 '/sales/display_goods')]
+
+    client = flask_app.test_client()
+    expected = [(response.status_code, response.get_json()) for response in (
+        client.get('/inventory/get_item/Laptop'), client.get('/inventory/get_item/Tablet'),
+        client.get('/sales/display_goods'))]
+    assert asyncio.run(run()) == expected
+    assert expected[0][1]["name"] == "Laptop" and expected[1][0] == 404
+    assert expected[2] == (200, [{"name": "Laptop", "price": 999.99}])
+
+
+def test_mmap_rate_limit_storage(tmp_path):
+    """
+    Test that the mmap storage enforces one limit across forked workers and other apps
+    using the same file, and that a lock held by a killed process is released.
+    """
+    import signal
+    import threading
+    from limits import parse
+    from limits.strategies import SlidingWindowCounterRateLimiter
+
+    uri = f"mmap://{tmp_path / 'ratelimit'}"
+    app = create_app(['inventory'], config={'SQLALCHEMY_DATABASE_URI': "sqlite:///:memory:",
+                                            'RATELIMIT_STORAGE_URI': uri})
+    limiter = next(iter(app.extensions['limiter']))
+    assert type(limiter.storage).__name__ == 'MmapStorage'
+    # Another app on the same file, such as a flask command next to a live server
+    other = create_app(['inventory'], config={'SQLALCHEMY_DATABASE_URI': "sqlite:///:memory:",
+                                              'RATELIMIT_STORAGE_URI': uri})
+
+    client = app.test_client()
+    statuses = [client.get('/inventory/get_item/Laptop').status_code for _ in range(20)]
+    assert 429 not in statuses
+    assert other.test_client().get('/inventory/get_item/Laptop').status_code == 429
+
+    # A worker killed while holding every stripe lock does not block the others
+    holder = subprocess.Popen([sys.executable, '-c', f"""
+import time
+from services.ratelimit import MmapStorage
+storage = MmapStorage({uri!r})
+for lock in storage._locks:
+    lock.acquire()
+print('held', flush=True)
+time.sleep(60)
+"""], stdout=subprocess.PIPE, text=True, cwd=os.path.join(os.path.dirname(__file__), '..'))
+    assert holder.stdout.readline().strip() == 'held'
+    waiting = threading.Thread(target=limiter.storage.incr, args=("after-kill", 60))
+    waiting.start()
+    waiting.join(0.2)
+    assert waiting.is_alive()
+    holder.send_signal(signal.SIGKILL)
+    holder.wait()
+    waiting.join(5)
+    assert not waiting.is_alive() and limiter.storage.get("after-kill") == 1
+
+    strategy = SlidingWindowCounterRateLimiter(limiter.storage)
+    limit = parse("50 per day")
+    read_fd, write_fd = os.pipe()
+    children = []
+    for _ in range(4):
+        pid = os.fork()
+        if pid == 0:
+            allowed = sum(strategy.hit(limit, "10.0.0.1") for _ in range(40))
+            os.write(write_fd, allowed.to_bytes(2, 'little'))
+            os._exit(0)
+        children.append(pid)
+    for pid in children:
+        os.waitpid(pid, 0)
+    allowed = os.read(read_fd, 8)
+    os.close(read_fd)
+    os.close(write_fd)
+    assert sum(int.from_bytes(allowed[i:i + 2], 'little') for i in range(0, 8, 2)) == 50
+    assert not strategy.hit(limit, "10.0.0.1") and strategy.hit(limit, "10.0.0.2")
+
+
+def test_rate_limits_by_identity_with_costs():
+    """
+    Test that limits are keyed by JWT identity, weighted per view, and skip health checks.
+    """
+    from flask_jwt_extended import create_access_token
+    from database.database import db
+    from services.ratelimit import rate_limit_status
+
+    app = create_app(['customers'], config={'SQLALCHEMY_DATABASE_URI': "sqlite:///:memory:"})
+    client = app.test_client()
+    with app.app_context():
+        db.create_all()
+        token = create_access_token(identity="1")
+
+    assert all(client.get('/customers/health').status_code == 200 for _ in range(25))
+
+    # A login costs 5 of the 20 requests a minute
+    login = {"username": "nobody", "password": "wrong"}
+    statuses = [client.post('/customers/login', json=login).status_code for _ in range(5)]
+    assert statuses == [401, 401, 401, 401, 429]
+    assert client.get('/customers/customer/nobody').status_code == 404
+
+    # The same address with a token has its own budget
+    headers = {'Authorization': f"Bearer {token}"}
+    assert client.post('/customers/login', json=login, headers=headers).status_code == 401
+
+    with app.test_request_context():
+        status = rate_limit_status()
+    assert status['checks'] == 7
+    assert status['rejections'] == {'customers.login': 1}
+    assert 0 < status['decision_seconds_max'] <= status['decision_seconds_total']
+
+
+def test_token_bucket_strategy(tmp_path):
+    """
+    Test that the token bucket allows a burst of the limit and then refills evenly.
+    """
+    import time
+    from limits import parse
+    from services.ratelimit import MmapStorage, TokenBucketRateLimiter
+
+    strategy = TokenBucketRateLimiter(MmapStorage(f"mmap://{tmp_path / 'ratelimit'}"))
+    limit = parse("4 per second")
+    assert [strategy.hit(limit, "client") for _ in range(5)] == [True, True, True, True, False]
+    assert not strategy.hit(limit, "client") and strategy.hit(limit, "other", cost=4)
+    assert strategy.get_window_stats(limit, "client").remaining == 0
+
+    time.sleep(0.3)
+    assert strategy.test(limit, "client") and not strategy.test(limit, "client", cost=2)
+    assert strategy.hit(limit, "client") and not strategy.hit(limit, "client")
+
+    with pytest.raises(NotImplementedError):
+        from limits.storage import MemoryStorage
+        TokenBucketRateLimiter(MemoryStorage())
+
+
+
+def test_metrics_endpoint(tmp_path):
+    """
+    Test that /metrics reports requests, latency and queries per route, and adds up
+    the counters other workers publish.
+    """
+    import json
+    from database.database import db
+
+    app = create_app(['inventory'], config={'SQLALCHEMY_DATABASE_URI': "sqlite:///:memory:",
+                                            'METRICS_DIR': str(tmp_path), 'RATELIMIT_ENABLED': False})
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+
+    def scrape():
+        response = client.get('/metrics')
+        assert response.status_code == 200 and response.mimetype == 'text/plain'
+        return dict(line.rsplit(' ', 1) for line in response.get_data(as_text=True).splitlines()
+                    if not line.startswith('#'))
+
+    route = '{route="inventory.get_items"}'
+    before = scrape()
+    for _ in range(3):
+        assert client.get('/inventory/get_items').status_code == 200
+    after = scrape()
+    assert int(after['http_requests_total' + route]) - int(before.get('http_requests_total' + route, 0)) == 3
+    assert after['http_request_duration_seconds_count' + route] == after['http_requests_total' + route]
+    assert after['http_request_duration_seconds_bucket{route="inventory.get_items",le="+Inf"}'] == \
+        after['http_requests_total' + route]
+    assert int(after['db_queries_total' + route]) - int(before.get('db_queries_total' + route, 0)) >= 3
+    assert 'cache_hits_total{cache="sql_compiled"}' in after
+
+    # Another worker's published totals are added to this worker's
+    (tmp_path / "1.json").write_text(json.dumps({
+        'routes': {'inventory.get_items': [2, 1, 0.5, 4, 0.1] + [0] * 12},
+        'caches': {}, 'pools': {}, 'rate_limit': {'checks': 0, 'decision_seconds_total': 0, 'rejections': {}}}))
+    merged = scrape()
+    assert int(merged['http_requests_total' + route]) == int(after['http_requests_total' + route]) + 2
+    assert int(merged['http_request_errors_total' + route]) == int(after['http_request_errors_total' + route]) + 1
+
+    # A worker that has exited keeps its counters, but not its pool gauges
+    exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True,
+                            text=True, check=True)
+    pid = int(exited.stdout)
+    (tmp_path / f"{pid}.json").write_text(json.dumps({
+        'routes': {'inventory.get_items': [5, 0, 0.5, 5, 0.1] + [0] * 12}, 'caches': {},
+        'pools': {'replica': {'size': 10, 'in_use': 4, 'idle': 6, 'overflow': 1, 'checkouts': 7}},
+        'rate_limit': {'checks': 0, 'decision_seconds_total': 0, 'rejections': {}}}))
+    dead = scrape()
+    assert int(dead['http_requests_total' + route]) == int(merged['http_requests_total' + route]) + 5
+    assert dead['db_pool_checkouts_total{bind="replica"}'] == '7'
+    assert not any(name.startswith('db_pool_') and 'replica' in name and 'checkouts' not in name for name in dead)
+
+    # The scrape folded its counters into the retired totals and deleted its file
+    assert not (tmp_path / f"{pid}.json").exists() and (tmp_path / "retired.json").exists()
+    retired = scrape()
+    assert retired['http_requests_total' + route] == dead['http_requests_total' + route]
+    assert retired['db_pool_checkouts_total{bind="replica"}'] == '7'
+
+
+def test_query_budget_warnings(caplog):
+    """
+    Test that a request repeating one statement, or running too many, logs a warning.
+    """
+    from database.database import db, InventoryItem
+
+    app = create_app(['inventory'], config={'SQLALCHEMY_DATABASE_URI': "sqlite:///:memory:",
+                                            'RATELIMIT_ENABLED': False, 'DB_QUERY_BUDGET': 8})
+
+    @app.route('/lookups/<int:count>')
+    def lookups(count):
+        for i in range(count):
+            db.session.get(InventoryItem, i + 1)
+        db.session.execute(db.select(InventoryItem.id)).all()
+        return {}
+
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+
+    client.get('/lookups/5')
+    assert not caplog.records
+    client.get('/lookups/6')
+    assert "GET /lookups/6 ran 7 SQL statements; possible N+1, ran 6 times: SELECT" in caplog.text
+    caplog.clear()
+    app.config['DB_QUERY_REPEAT_BUDGET'] = 0
+    client.get('/lookups/8')
+    assert "ran 9 SQL statements (budget 8); most repeated, ran 8 times" in caplog.text
+
+
+def test_profile_requests(tmp_path):
+    """
+    Test that requests sending the profile key are profiled and summarized, that sampled
+    requests are saved quietly, and that only the newest profiles are kept.
+    """
+    import pstats
+
+    config = {'SQLALCHEMY_DATABASE_URI': "sqlite:///:memory:", 'RATELIMIT_ENABLED': False,
+              'PROFILE_KEY': "secret", 'PROFILE_DIR': str(tmp_path), 'PROFILE_KEEP': 2}
+    client = create_app(['inventory'], config=config).test_client()
+
+    assert 'X-Profile-File' not in client.get('/inventory/health').headers
+    assert 'X-Profile-File' not in client.get('/inventory/health', headers={'X-Profile': '1',
+                                                                            'X-Profile-Key': 'guess'}).headers
+    assert not list(tmp_path.iterdir())
+
+    response = client.get('/inventory/health', headers={'X-Profile': '1', 'X-Profile-Key': 'secret'})
+    assert response.status_code == 200
+    assert response.headers['X-Profile-File'].startswith('inventory.health_check-')
+    assert '(health_check)' in response.headers['X-Profile-Summary']
+    assert len(response.headers['X-Profile-Summary'].split('; ')) == 10
+    stats = pstats.Stats(str(tmp_path / response.headers['X-Profile-File']))
+    assert any(name == 'health_check' for _, _, name in stats.stats)
+
+    sampled = create_app(['inventory'], config=dict(config, PROFILE_KEY=None, PROFILE_SAMPLE_RATE=1)).test_client()
+    for _ in range(2):
+        assert 'X-Profile-File' not in sampled.get('/inventory/health').headers
+    assert len(list(tmp_path.iterdir())) == 2
+
+    plain = create_app(['inventory'], config={'SQLALCHEMY_DATABASE_URI': "sqlite:///:memory:"})
+    assert 'start_profile' not in [hook.__name__ for hook in plain.before_request_funcs[None]]
+
+
+def test_debug_profile_samples_stacks(tmp_path):
+    """
+    Test that /debug/profile returns the folded stacks of the worker's other threads.
+    """
+    import threading
+    import time
+
+    config = {'SQLALCHEMY_DATABASE_URI': "sqlite:///:memory:", 'RATELIMIT_ENABLED': False,
+              'PROFILE_KEY': "secret", 'PROFILE_DIR': str(tmp_path), 'PROFILE_MAX_SECONDS': 5}
+    client = create_app(['inventory'], config=config).test_client()
+    headers = {'X-Profile-Key': 'secret'}
+
+    assert client.get('/debug/profile?seconds=0.1').status_code == 403
+    assert client.get('/debug/profile?seconds=0', headers=headers).status_code == 400
+    assert client.get('/debug/profile?seconds=6', headers=headers).status_code == 400
+
+    done = threading.Event()
+
+    def spin_in_busy_loop():
+        while not done.is_set():
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=spin_in_busy_loop, name='busy-worker')
+    thread.start()
+    try:
+        response = client.get('/debug/profile?seconds=0.2', headers=headers)
+    finally:
+        done.set()
+        thread.join()
+    assert response.status_code == 200
+    assert 0 < int(response.headers['X-Profile-Samples']) <= 21
+    stacks = [line.rsplit(' ', 1) for line in response.get_data(as_text=True).splitlines()]
+    busy = [(stack.split(';'), int(count)) for stack, count in stacks if stack.startswith('busy-worker;')]
+    assert busy and all(frames[-1].startswith('spin_in_busy_loop (') for frames, _ in busy)
+    assert sum(count for _, count in busy) == int(response.headers['X-Profile-Samples'])
+
+    plain = create_app(['inventory'], config={'SQLALCHEMY_DATABASE_URI': "sqlite:///:memory:"}).test_client()
+    assert plain.get('/debug/profile', headers=headers).status_code == 404
+
+
+def test_memory_tracing(tmp_path):
+    """
+    Test that memory tracing reports each route's allocations, and the growth since a
+    baseline that a leaking route causes.
+    """
+    import tracemalloc
+
+    leaked = []
+    config = {'SQLALCHEMY_DATABASE_URI': "sqlite:///:memory:", 'RATELIMIT_ENABLED': False,
+              'MEMORY_TRACE': True, 'MEMORY_TRACE_SITES_EVERY': 2, 'PROFILE_KEY': "secret",
+              'PROFILE_DIR': str(tmp_path)}
+    app = create_app(['inventory'], config=config)
+
+    @app.route('/leak')
+    def leak():
+        leaked.append([bytes(1000) for _ in range(100)])
+        return {}
+
+    client = app.test_client()
+    headers = {'X-Profile-Key': 'secret'}
+    try:
+        assert client.post('/debug/memory/baseline').status_code == 403
+        client.get('/leak')  # Warm up, so Flask's own first-request allocations come before the baseline
+        assert client.post('/debug/memory/baseline', headers=headers).status_code == 200
+        for _ in range(5):
+            assert client.get('/leak').status_code == 200
+        client.get('/inventory/health')
+        report = client.get('/debug/memory', headers=headers).get_json()
+    finally:
+        tracemalloc.stop()
+
+    route = report['routes']['leak']
+    assert route['requests'] == 6 and route['snapshots'] == 3
+    assert route['peak_bytes_max'] >= 100 * 1000 and route['retained_bytes_total'] >= 6 * 100 * 1000
+    assert route['top_sites'][0]['site'].startswith('test_app.py:') and route['top_sites'][0]['blocks'] >= 300
+    assert 'inventory.health_check' in report['routes'] and 'memory_report' not in report['routes']
+
+    growth = report['since_baseline']
+    assert growth['requests'] == 6
+    assert growth['top_sites'][0]['site'] == route['top_sites'][0]['site']
+    assert 5 * 100 * 1000 <= growth['top_sites'][0]['bytes'] < 6 * 100 * 1000 + 10000
+
+
+def test_json_provider(monkeypatch):
+    """
+    Test that responses encode datetimes natively, in the same form with and without orjson.
+    """
+    from datetime import date, datetime
+    from decimal import Decimal
+    from services import serialization
+
+    app = create_app(['inventory'], config={'SQLALCHEMY_DATABASE_URI': "sqlite:///:memory:"})
+    payload = {"b": [datetime(2024, 5, 1, 12, 30, 0, 123456)], "a": date(2024, 5, 1), "price": Decimal("9.50"),
+               "name": "Café", "stars": {5: 2, 1: 0}}
+    expected = {"b": ["2024-05-01T12:30:00"], "a": "2024-05-01", "price": "9.50", "name": "Café",
+                "stars": {"5": 2, "1": 0}}
+
+    encoded = []
+    for orjson in (serialization.orjson, None):
+        monkeypatch.setattr(serialization, 'orjson', orjson)
+        with app.app_context():
+            response = app.json.response(payload)
+            assert app.json.loads(app.json.dumps(payload)) == expected
+        assert response.mimetype == 'application/json' and response.get_json() == expected
+        assert list(response.get_json()) == ["b", "a", "price", "name", "stars"]
+        encoded.append(serialization.to_json(payload))
+    assert all(serialization.json.loads(value) == expected for value in encoded)
+    assert [list(serialization.json.loads(value)["stars"]) for value in encoded] == [["5", "1"], ["5", "1"]]
+
+
+def test_response_compression():
+    """
+    Test that large responses are gzipped when accepted, streams are compressed as they
+    are written, and repeated bodies come from the cache.
+    """
+    import gzip
+    import zlib
+    from flask import Response, stream_with_context
+    from services.compression import available_encodings, compress_stream
+    from services.metrics import snapshot
+
+    app = create_app(['inventory'], config={'SQLALCHEMY_DATABASE_URI': "sqlite:///:memory:",
+                                            'RATELIMIT_ENABLED': False})
+    rows = [{"name": f"Item {i}", "category": "Electronics", "price": 10.0 + i} for i in range(200)]
+
+    @app.route('/rows/<int:count>')
+    def listing(count):
+        return rows[:count]
+
+    @app.route('/stream')
+    def stream():
+        return Response(stream_with_context(f"{i}\n" for i in range(5000)), mimetype='application/x-ndjson')
+
+    client = app.test_client()
+    plain = client.get('/rows/200')
+    assert 'Content-Encoding' not in plain.headers and plain.headers['Vary'] == 'Accept-Encoding'
+    assert 'Content-Encoding' not in client.get('/rows/2', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get('/rows/200', headers={'Accept-Encoding': 'gzip;q=0, br'}).headers
+
+    with app.app_context():
+        before = snapshot()
+    responses = [client.get('/rows/200', headers={'Accept-Encoding': 'deflate, gzip'}) for _ in range(2)]
+    for response in responses:
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert int(response.headers['Content-Length']) == len(response.data) < len(plain.data) // 5
+        assert gzip.decompress(response.data) == plain.data
+        assert f'desc="gzip {len(plain.data)} to {len(response.data)} bytes"' in response.headers['Server-Timing']
+
+    streamed = client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert streamed.headers['Content-Encoding'] == 'gzip' and 'Content-Length' not in streamed.headers
+    assert gzip.decompress(streamed.data) == ''.join(f"{i}\n" for i in range(5000)).encode()
+
+    # Every chunk reaches the client whole as soon as it is written, not when the compressor's buffer fills
+    decompressor = zlib.decompressobj(31)
+    chunks = [b'{"id": %d}\n' % i for i in range(3)]
+    compressed = compress_stream(iter(chunks), 'gzip', available_encodings(app.config)['gzip']())
+    for chunk, output in zip(chunks, compressed):
+        assert decompressor.decompress(output) == chunk
+
+    with app.app_context():
+        after = snapshot()
+    gzipped = [a - b for a, b in zip(after['compression']['gzip'], before['compression'].get('gzip', [0] * 4))]
+    assert gzipped[0] == 3 and gzipped[1] == 2 * len(plain.data) + len(gzip.decompress(streamed.data))
+    cached = [a - b for a, b in zip(after['caches']['compressed_bodies'],
+                                    before['caches'].get('compressed_bodies', [0, 0]))]
+    assert cached == [1, 1]
+
+    disabled = create_app(['inventory'], config={'SQLALCHEMY_DATABASE_URI': "sqlite:///:memory:",
+                                                 'COMPRESS_ENABLED': False})
+    response = disabled.test_client().get('/metrics', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
@@ -230,3 +230,66 @@ def test_register_customer_invalid_marital_status(client):
     })
     assert response.status_code == 400
     assert "Marital status must be one of 'Single', 'Married', 'Divorced', or 'Widowed' (case-insensitive)." in response.get_json()["errors"]
+
+
+def test_customer_stats(client):
+    """
+    Test that the demographic counters follow register, update, charge and delete.
+    """
+    client.post('/customers/register', json={
+        "full_name": "John Doe",
+        "username": "johndoe",
+        "password": "securepassword",
+        "age": 30,
+        "gender": "Male",
+        "marital_status": "Single"
+    })
+    client.post('/customers/register', json={
+        "full_name": "Jane Smith",
+        "username": "janesmith",
+        "password": "securepassword",
+        "age": 70,
+        "gender": "Female",
+        "marital_status": "Married"
+    })
+    client.post('/customers/charge/janesmith', json={"amount": 150})
+    client.put('/customers/update/johndoe', json={
+        "full_name": "John Doe",
+        "username": "johndoe",
+        "password": "securepassword",
+        "age": 40,
+        "marital_status": "married"
+    })
+
+    data = client.get('/customers/stats').get_json()
+    assert data["total"] == 2
+    assert data["wallet_total"] == 150
+    assert data["age"] == {"35-44": 1, "65+": 1}
+    assert data["gender"] == {"Male": 1, "Female": 1}
+    assert data["marital_status"] == {"Married": 2}
+    assert data["wallet"] == {"0-50": {"count": 1, "total": 0}, "100-500": {"count": 1, "total": 150}}
+
+    client.delete('/customers/delete/janesmith')
+    data = client.get('/customers/stats').get_json()
+    assert data["total"] == 1
+    assert data["gender"] == {"Male": 1}
+    assert data["wallet"] == {"0-50": {"count": 1, "total": 0}}
+
+
+def test_rebuild_customer_stats(client):
+    """
+    Test that a full rebuild reproduces the incrementally maintained counters.
+    """
+    from services.customers.customers import rebuild_customer_stats
+    for username, age in (("johndoe", 30), ("janesmith", None)):
+        client.post('/customers/register', json={
+            "full_name": "Some Body",
+            "username": username,
+            "password": "securepassword",
+            "age": age,
+            "gender": "Other"
+        })
+    before = client.get('/customers/stats').get_json()
+    with app.app_context():
+        assert rebuild_customer_stats(batch_size=1) == 2
+    assert client.get('/customers/stats').get_json() == before
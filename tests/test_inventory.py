@@ -160,6 +160,38 @@ def test_get_item(client):
     assert item["stock"] == 50
 
 
+def test_get_item_conditional(client):
+    """
+    Test that item reads answer If-None-Match and If-Modified-Since with 304 until the
+    item changes.
+    """
+    client.post('/inventory/add_item', json={
+        "name": "Laptop",
+        "category": "electronics",
+        "price": 1200.99,
+        "description": "High-performance laptop",
+        "stock": 50
+    })
+    response = client.get('/inventory/get_item/Laptop')
+    etag = response.headers["ETag"]
+    assert etag.startswith('"') and response.headers["Cache-Control"] == "no-cache"
+
+    response = client.get('/inventory/get_item/Laptop', headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.data == b"" and response.headers["ETag"] == etag
+    gzip_etag = etag[:-1] + '-gzip"'  # As services/compression.py tags compressed bodies
+    response = client.get('/inventory/get_item/Laptop', headers={"If-None-Match": f'"other", {gzip_etag}'})
+    assert response.status_code == 304 and response.headers["ETag"] == gzip_etag
+    since = client.get('/inventory/get_item/Laptop').headers["Last-Modified"]
+    assert client.get('/inventory/get_item/Laptop', headers={"If-Modified-Since": since}).status_code == 304
+    assert client.get('/sales/goods/Laptop', headers={"If-None-Match": etag}).status_code == 304
+
+    client.put('/inventory/update_item/Laptop', json={"category": "electronics", "price": 1100.0,
+                                                      "description": "High-performance laptop", "stock": 49})
+    response = client.get('/inventory/get_item/Laptop', headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.get_json()["stock"] == 49
+    assert response.headers["ETag"] != etag
+
+
 def test_delete_item(client):
     """
     Test deleting an inventory item.
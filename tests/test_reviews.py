@@ -1,6 +1,10 @@
 import pytest
 from app import app
 from database.database import db, Customer, InventoryItem, Review
+from datetime import datetime
+import json
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 
 @pytest.fixture
 def client():
@@ -325,10 +329,11 @@ def test_moderate_review_delete(client):
     assert response.status_code == 200
     assert response.get_json()["message"] == "Review deleted successfully."
 
-    # Check that the review is deleted
+    # Check that the review is soft-deleted
     with app.app_context():
         review = db.session.get(Review, review_id)
-        assert review is None
+        assert review.status == 'deleted'
+        assert review.deleted_at is not None
 
 def test_moderate_review_invalid_action(client):
     """
@@ -398,3 +403,514 @@ def test_get_flagged_reviews(client):
     assert flagged_reviews[0]["id"] == 1
     assert flagged_reviews[0]["comment"] == "Average."
 
+
+def test_rating_summary(client):
+    """
+    Test that the rating summary follows approve, flag and delete moderation.
+    """
+    with app.app_context():
+        for customer_id, rating in ((1, 5), (2, 3)):
+            db.session.add(Review(customer_id=customer_id, item_id=1, rating=rating, comment="Fine."))
+        db.session.commit()
+
+    client.post('/reviews/moderate/1', json={"action": "approve"})
+    client.post('/reviews/moderate/2', json={"action": "approve"})
+    summary = client.get('/reviews/summary/Laptop').get_json()
+    assert summary["count"] == 2
+    assert summary["average"] == 4
+    assert summary["histogram"] == {"1": 0, "2": 0, "3": 1, "4": 0, "5": 1}
+    assert summary["last_approved"] is not None
+
+    client.post('/reviews/flag/1')
+    client.post('/reviews/moderate/2', json={"action": "delete"})
+    summary = client.get('/reviews/summary/Laptop').get_json()
+    assert summary["count"] == 0
+    assert summary["average"] is None
+
+def test_rating_summary_missing_row(client):
+    """
+    Test that removing a review from an item without a summary row does not insert negative counts.
+    """
+    from database.database import ItemRating
+    with app.app_context():
+        db.session.add(Review(customer_id=1, item_id=1, rating=5, comment="Fine.", status='approved'))
+        db.session.commit()
+
+    client.post('/reviews/flag/1')
+    with app.app_context():
+        assert db.session.get(ItemRating, 1) is None
+
+def test_rating_summary_concurrent_first_approvals(tmp_path):
+    """
+    Test that two sessions approving an item's first reviews at once both count.
+    """
+    import threading
+    from services import create_app
+    from database.database import ItemRating, apply_item_rating_batch
+    shared = create_app(['reviews'], config={'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'ratings.db'}"})
+    with shared.app_context():
+        db.create_all()
+        db.session.add(InventoryItem(name="Laptop", category="electronics", price=999.99, stock=10))
+        db.session.commit()
+    first_written, errors = threading.Event(), []
+
+    def approve(rating, wait=None):
+        with shared.app_context():
+            try:
+                if wait:
+                    wait.wait()
+                apply_item_rating_batch([], [(1, rating, 0.5)])
+                if not wait:
+                    # Hold the uncommitted row while the other session approves
+                    first_written.set()
+                    threading.Event().wait(0.2)
+                db.session.commit()
+            except Exception as error:
+                errors.append(error)
+
+    threads = [threading.Thread(target=approve, args=(5,)), threading.Thread(target=approve, args=(3, first_written))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with shared.app_context():
+        summary = db.session.get(ItemRating, 1)
+        assert (summary.category, summary.count, summary.rating_sum, summary.rating_3, summary.rating_5) == (
+            "Electronics", 2, 8, 1, 1)
+        assert summary.bayesian_score == pytest.approx((10 * 3.0 + 8) / 12)
+        assert summary.sentiment_count == 2
+
+        # An item deleted before its review is approved gets no summary
+        apply_item_rating_batch([], [(2, 4, None)])
+        assert db.session.get(ItemRating, 2) is None
+
+def test_rating_summary_batch(client):
+    """
+    Test retrieving rating summaries for several items at once.
+    """
+    with app.app_context():
+        db.session.add(Review(customer_id=1, item_id=1, rating=4, comment="Good."))
+        db.session.commit()
+    client.post('/reviews/moderate/1', json={"action": "approve"})
+
+    response = client.get('/reviews/summary?items=Laptop,Smartphone')
+    assert response.status_code == 200
+    summaries = response.get_json()
+    assert list(summaries) == ["Laptop"]
+    assert summaries["Laptop"]["average"] == 4
+    assert client.get('/reviews/summary/Smartphone').status_code == 404
+
+    from services.reviews.reviews import rebuild_item_ratings
+    with app.app_context():
+        assert rebuild_item_ratings() == 1
+    assert client.get('/reviews/summary/Laptop').get_json()["histogram"]["4"] == 1
+
+def test_get_product_reviews_pagination(client):
+    """
+    Test keyset pagination and sorting of a product's approved reviews.
+    """
+    with app.app_context():
+        db.session.add(Customer(full_name="Sam Lee", username="samlee", password="hashed_password"))
+        for customer_id, rating, day in ((1, 3, 1), (2, 5, 2), (3, 4, 3)):
+            db.session.add(Review(customer_id=customer_id, item_id=1, rating=rating, comment="Ok.",
+                                  status='approved', timestamp=datetime(2024, 1, day)))
+        db.session.commit()
+
+    response = client.get('/reviews/product_reviews/Laptop?sort=newest&limit=2')
+    assert response.status_code == 200
+    assert [r["username"] for r in response.get_json()] == ["samlee", "janesmith"]
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(f'/reviews/product_reviews/Laptop?sort=newest&limit=2&cursor={cursor}')
+    assert [r["username"] for r in response.get_json()] == ["johndoe"]
+    assert "X-Next-Cursor" not in response.headers
+
+    response = client.get('/reviews/product_reviews/Laptop?sort=rating')
+    assert [r["rating"] for r in response.get_json()] == [5, 4, 3]
+
+    assert client.get('/reviews/product_reviews/Laptop?sort=random').status_code == 400
+    assert client.get('/reviews/product_reviews/Laptop?cursor=garbage').status_code == 400
+
+def test_conditional_review_reads(client):
+    """
+    Test that review pages and details answer If-None-Match with 304 until a review on
+    them, or its author, changes.
+    """
+    with app.app_context():
+        db.session.add(Review(customer_id=1, item_id=1, rating=4, comment="Good.", status='approved'))
+        db.session.add(Review(customer_id=2, item_id=1, rating=2, comment="Meh.", status='pending'))
+        db.session.commit()
+
+    etag = client.get('/reviews/product_reviews/Laptop').headers["ETag"]
+    response = client.get('/reviews/product_reviews/Laptop', headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.data == b""
+    details = client.get('/reviews/review/1').headers["ETag"]
+    assert client.get('/reviews/review/1', headers={"If-None-Match": details}).status_code == 304
+
+    with app.app_context():
+        db.session.execute(db.update(Review).where(Review.id == 2).values(status='approved'))
+        db.session.commit()
+    response = client.get('/reviews/product_reviews/Laptop', headers={"If-None-Match": etag})
+    assert response.status_code == 200 and len(response.get_json()) == 2
+    assert client.get('/reviews/review/1', headers={"If-None-Match": details}).status_code == 304
+
+    with app.app_context():
+        db.session.get(Customer, 1).wallet = 50.0
+        db.session.commit()
+    assert client.get('/reviews/review/1', headers={"If-None-Match": details}).status_code == 200
+
+def test_get_customer_reviews_pagination(client):
+    """
+    Test keyset pagination of a customer's reviews across items.
+    """
+    with app.app_context():
+        db.session.add(InventoryItem(name="Mouse", category="Accessories", price=49.99, stock=20))
+        db.session.add(Review(customer_id=1, item_id=1, rating=5, timestamp=datetime(2024, 1, 1)))
+        db.session.add(Review(customer_id=1, item_id=2, rating=4, timestamp=datetime(2024, 1, 2)))
+        db.session.commit()
+
+    response = client.get('/reviews/customer_reviews/johndoe?limit=1')
+    assert [r["item_name"] for r in response.get_json()] == ["Laptop"]
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(f'/reviews/customer_reviews/johndoe?limit=1&cursor={cursor}')
+    assert [r["item_name"] for r in response.get_json()] == ["Mouse"]
+    assert response.get_json()[0]["status"] == "pending"
+
+def test_moderate_batch(client):
+    """
+    Test bulk moderation by ID list and by filter, keeping rating summaries in step.
+    """
+    with app.app_context():
+        db.session.add(Review(customer_id=1, item_id=1, rating=5, comment="Great."))
+        db.session.add(Review(customer_id=2, item_id=1, rating=2, comment="Meh."))
+        db.session.commit()
+
+    response = client.post('/reviews/moderate_batch', json={"action": "approve", "review_ids": [1, 2, 99]})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["processed"] == 2
+    assert data["results"] == [
+        {"review_id": 1, "outcome": "approved"},
+        {"review_id": 2, "outcome": "approved"},
+        {"review_id": 99, "outcome": "not_found"},
+    ]
+    assert client.get('/reviews/summary/Laptop').get_json()["count"] == 2
+
+    response = client.post('/reviews/moderate_batch', json={"action": "approve", "review_ids": [1]})
+    assert response.get_json()["results"] == [{"review_id": 1, "outcome": "unchanged"}]
+
+    response = client.post('/reviews/moderate_batch', json={
+        "action": "flag", "filter": {"status": "approved", "item_name": "Laptop", "limit": 1}
+    })
+    assert response.get_json()["results"] == [{"review_id": 1, "outcome": "flagged"}]
+    summary = client.get('/reviews/summary/Laptop').get_json()
+    assert summary["count"] == 1
+    assert summary["histogram"]["2"] == 1
+
+    response = client.post('/reviews/moderate_batch', json={"action": "delete", "review_ids": [1, 2]})
+    assert response.get_json()["processed"] == 2
+    assert client.get('/reviews/summary/Laptop').get_json()["count"] == 0
+    with app.app_context():
+        assert Review.query.filter_by(status='deleted').count() == 2
+
+def test_moderate_batch_invalid(client):
+    """
+    Test bulk moderation input validation.
+    """
+    response = client.post('/reviews/moderate_batch', json={"action": "burn", "review_ids": [1]})
+    assert response.status_code == 400
+    response = client.post('/reviews/moderate_batch', json={"action": "approve"})
+    assert response.status_code == 400
+    response = client.post('/reviews/moderate_batch', json={"action": "approve", "filter": {"status": "deleted"}})
+    assert response.status_code == 400
+    response = client.post('/reviews/moderate_batch', json={"action": "approve", "filter": "pending"})
+    assert response.status_code == 400
+
+def test_screen_pending_reviews(client):
+    """
+    Test that the screening worker approves clean reviews, flags spam and leaves the rest.
+    """
+    from services.reviews.screening import ReviewScreener, queue_pending_reviews, screen_pending_reviews
+    with app.app_context():
+        db.session.add(InventoryItem(name="Mouse", category="Accessories", price=49.99, stock=20))
+        db.session.add(Review(customer_id=1, item_id=1, rating=5, comment="Works great, fast delivery."))
+        db.session.add(Review(customer_id=2, item_id=1, rating=1, comment="Click here for FREE MONEY http://spam.example"))
+        db.session.add(Review(customer_id=1, item_id=2, rating=2, comment="THIS MOUSE STOPPED WORKING AFTER A WEEK"))
+        db.session.commit()
+
+        assert queue_pending_reviews() == 3
+        result = screen_pending_reviews(ReviewScreener(), batch_size=10)
+        assert result == {"dequeued": 3, "screened": 3, "approved": 1, "flagged": 1}
+        assert [r.status for r in Review.query.order_by(Review.id)] == ["approved", "flagged", "pending"]
+
+    assert client.get('/reviews/summary/Laptop').get_json()["count"] == 1
+
+def test_screening_worker_rescreens_edited_reviews(client, monkeypatch):
+    """
+    Test that the worker scores a review left pending once, and again after it is resubmitted.
+    """
+    from services.reviews import screening
+    from services.reviews.reviews import upsert_review
+    with app.app_context():
+        db.session.add(Review(customer_id=1, item_id=1, rating=2, comment="THIS LAPTOP STOPPED WORKING AFTER A WEEK"))
+        db.session.commit()
+
+    scored, passes = [], []
+    screener = screening.ReviewScreener()
+    monkeypatch.setattr(screener, 'classify', lambda comment: scored.append(comment))
+
+    def sleep(interval):
+        passes.append(interval)
+        if len(passes) == 1:
+            with app.app_context():
+                upsert_review(1, 1, 2, "STILL NOT WORKING, SENT IT BACK TWICE")
+                upsert_review(2, 1, 5, "Works great.")
+                db.session.commit()
+        if len(passes) == 3:
+            raise StopIteration
+
+    monkeypatch.setattr(screening.time, 'sleep', sleep)
+    with pytest.raises(StopIteration):
+        screening.run_worker(app, screener, batch_size=10, interval=0)
+    assert scored == ["THIS LAPTOP STOPPED WORKING AFTER A WEEK", "STILL NOT WORKING, SENT IT BACK TWICE",
+                      "Works great."]
+
+def test_leaderboard(client):
+    """
+    Test category leaderboards by Bayesian-average rating and by review count.
+    """
+    with app.app_context():
+        db.session.add(Customer(full_name="Sam Lee", username="samlee", password="hashed_password"))
+        db.session.add(InventoryItem(name="Phone", category="Electronics", price=499.99, stock=5))
+        db.session.add(InventoryItem(name="Shirt", category="Clothes", price=19.99, stock=50))
+        # Laptop: three 4-star reviews. Phone: a single 5-star review.
+        for customer_id in (1, 2, 3):
+            db.session.add(Review(customer_id=customer_id, item_id=1, rating=4))
+        db.session.add(Review(customer_id=1, item_id=2, rating=5))
+        db.session.add(Review(customer_id=1, item_id=3, rating=5))
+        db.session.commit()
+    client.post('/reviews/moderate_batch', json={"action": "approve", "filter": {"status": "pending"}})
+
+    response = client.get('/reviews/leaderboard?category=electronics')
+    assert response.status_code == 200
+    board = response.get_json()
+    assert [(entry["rank"], entry["item_name"]) for entry in board] == [(1, "Laptop"), (2, "Phone")]
+    assert board[0]["bayesian_average"] == round((30 + 12) / 13, 2)
+
+    board = client.get('/reviews/leaderboard?by=count&limit=1').get_json()
+    assert [entry["item_name"] for entry in board] == ["Laptop"]
+
+    # Flagging the Laptop reviews drops it off the board in the same transaction
+    client.post('/reviews/moderate_batch', json={"action": "flag", "filter": {"status": "approved", "item_name": "Laptop"}})
+    board = client.get('/reviews/leaderboard?category=Electronics').get_json()
+    assert [entry["item_name"] for entry in board] == ["Phone"]
+    assert client.get('/reviews/leaderboard?by=price').status_code == 400
+
+def test_upsert_review(client):
+    """
+    Test that submitting twice for the same item replaces the review instead of duplicating it.
+    """
+    from services.reviews.reviews import upsert_review
+    with app.app_context():
+        upsert_review(1, 1, 5, "Excellent product!")
+        db.session.commit()
+        client.post('/reviews/moderate/1', json={"action": "approve"})
+        assert client.get('/reviews/summary/Laptop').get_json()["count"] == 1
+
+        upsert_review(1, 1, 2, "Broke after a week.")
+        db.session.commit()
+        reviews = Review.query.all()
+        assert len(reviews) == 1
+        assert (reviews[0].rating, reviews[0].comment, reviews[0].status) == (2, "Broke after a week.", "pending")
+        assert reviews[0].version == 3  # Inserted, approved, then replaced once
+    assert client.get('/reviews/summary/Laptop').get_json()["count"] == 0
+
+def test_dedupe_reviews(client):
+    """
+    Test collapsing pre-existing duplicate reviews and adding the unique index.
+    """
+    from services.reviews.reviews import dedupe_reviews
+    with app.app_context():
+        db.session.execute(text('DROP INDEX uq_review_customer_item'))
+        for rating in (3, 4, 5):
+            db.session.add(Review(customer_id=1, item_id=1, rating=rating, status='approved'))
+        db.session.add(Review(customer_id=2, item_id=1, rating=1))
+        db.session.commit()
+        assert dedupe_reviews(batch_size=1) == 2
+        assert sorted((r.customer_id, r.rating) for r in Review.query.all()) == [(1, 5), (2, 1)]
+
+        db.session.add(Review(customer_id=2, item_id=1, rating=2))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+
+def test_soft_delete_and_purge(client):
+    """
+    Test that deleted reviews are hidden at once and purged after the retention period.
+    """
+    from services.reviews.reviews import purge_deleted_reviews
+    with app.app_context():
+        db.session.add(Review(customer_id=1, item_id=1, rating=4, comment="Fine."))
+        db.session.add(Review(customer_id=2, item_id=1, rating=2, comment="Old.", status='deleted',
+                              deleted_at=datetime(2024, 1, 1)))
+        db.session.commit()
+
+    client.post('/reviews/moderate/1', json={"action": "delete"})
+    assert client.get('/reviews/review/1').status_code == 404
+    assert client.post('/reviews/flag/1').status_code == 404
+    assert client.get('/reviews/customer_reviews/johndoe').get_json() == []
+
+    with app.app_context():
+        assert purge_deleted_reviews(retention_days=7, batch_size=1, pause=0) == 1
+        assert [r.id for r in Review.query.all()] == [1]
+        assert purge_deleted_reviews(retention_days=0, pause=0) == 1
+        assert Review.query.count() == 0
+
+def test_search_reviews(client):
+    """
+    Test full-text search over review comments with status, rating and item filters.
+    """
+    from services.reviews.reviews import upsert_review
+    from services.reviews.search import index_queued_reviews
+    with app.app_context():
+        db.session.add(InventoryItem(name="Mouse", category="Accessories", price=49.99, stock=20))
+        upsert_review(1, 1, 2, "The battery died after two days.")
+        upsert_review(2, 1, 5, "Great screen, battery lasts all day!")
+        upsert_review(1, 2, 1, "Scroll wheel died within a week.")
+        db.session.commit()
+    client.post('/reviews/moderate/2', json={"action": "approve"})
+
+    # Submissions only queue reviews; nothing is searchable until the worker indexes them
+    assert client.get('/reviews/search?q=battery').get_json() == []
+    with app.app_context():
+        assert index_queued_reviews(batch_size=2) == 2
+        assert index_queued_reviews() == 1
+        assert index_queued_reviews() == 0
+
+    response = client.get('/reviews/search?q=battery')
+    assert response.status_code == 200
+    assert [r["id"] for r in response.get_json()] == [2, 1]
+
+    assert [r["id"] for r in client.get('/reviews/search?q=died').get_json()] == [3, 1]
+    assert [r["id"] for r in client.get('/reviews/search?q=battery+died').get_json()] == [1]
+    assert [r["id"] for r in client.get('/reviews/search?q=battery&status=approved').get_json()] == [2]
+    assert [r["id"] for r in client.get('/reviews/search?q=died&rating=1').get_json()] == [3]
+    assert [r["item_name"] for r in client.get('/reviews/search?q=died&item=Mouse').get_json()] == ["Mouse"]
+
+    # Edited and deleted reviews drop out even though their postings remain
+    with app.app_context():
+        upsert_review(1, 1, 3, "Replaced under warranty, fine now.")
+        db.session.commit()
+        index_queued_reviews()
+    client.post('/reviews/moderate/3', json={"action": "delete"})
+    assert client.get('/reviews/search?q=died').get_json() == []
+    assert [r["id"] for r in client.get('/reviews/search?q=warranty').get_json()] == [1]
+    assert client.get('/reviews/search?q=the').get_json() == []
+    assert client.get('/reviews/search').status_code == 400
+
+    from services.reviews.search import rebuild_search_index
+    with app.app_context():
+        rebuild_search_index(batch_size=1, flush_every=1)
+    assert [r["id"] for r in client.get('/reviews/search?q=battery').get_json()] == [2]
+
+def test_index_same_new_term_concurrently(tmp_path):
+    """
+    Test that two sessions adding the same new term both land in its posting list.
+    """
+    import threading
+    from services import create_app
+    from services.reviews.search import add_postings, load_postings
+    shared = create_app(['reviews'], config={'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'index.db'}"})
+    with shared.app_context():
+        db.create_all()
+    first_written, errors = threading.Event(), []
+
+    def index(review_id, wait=None):
+        with shared.app_context():
+            try:
+                if wait:
+                    wait.wait()
+                add_postings({'warranty': [review_id]})
+                if not wait:
+                    # Hold the uncommitted posting while the other session writes the same term
+                    first_written.set()
+                    threading.Event().wait(0.2)
+                db.session.commit()
+            except Exception as error:
+                errors.append(error)
+
+    threads = [threading.Thread(target=index, args=(1,)), threading.Thread(target=index, args=(2, first_written))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with shared.app_context():
+        assert load_postings('warranty') == {1, 2}
+
+def test_posting_compression():
+    """
+    Test that posting blocks round-trip through the varint encoding.
+    """
+    from services.reviews.search import encode_postings, decode_postings
+    ids = [1, 2, 130, 20000, 5000000]
+    data = encode_postings(ids)
+    assert decode_postings(data) == ids
+    assert len(data) < 4 * len(ids)
+
+def test_get_flagged_reviews_pagination(client):
+    """
+    Test keyset paging and NDJSON streaming of the flagged queue.
+    """
+    with app.app_context():
+        db.session.add(Customer(full_name="Sam Lee", username="samlee", password="hashed_password"))
+        for customer_id in (1, 2, 3):
+            db.session.add(Review(customer_id=customer_id, item_id=1, rating=1, comment="Spam", status='flagged'))
+        db.session.commit()
+
+    response = client.get('/reviews/flagged?limit=2')
+    assert [r["id"] for r in response.get_json()] == [1, 2]
+    response = client.get(f'/reviews/flagged?limit=2&cursor={response.headers["X-Next-Cursor"]}')
+    assert [r["id"] for r in response.get_json()] == [3]
+    assert "X-Next-Cursor" not in response.headers
+
+    response = client.get('/reviews/flagged/stream')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [1, 2, 3]
+
+def test_sentiment_scorer():
+    """
+    Test that the vectorized batch scorer agrees with the single-comment scorer.
+    """
+    from services.reviews.sentiment import SentimentScorer
+    scorer = SentimentScorer()
+    comments = ["Great laptop, I love it!", "Not good. Screen cracked.", "", None, "no", "It is a laptop."]
+    batch = scorer.score_batch(comments)
+    assert batch == pytest.approx([scorer.score(comment) for comment in comments])
+    assert batch[0] > 0.5
+    assert batch[1] < -0.5
+    assert batch[2] == batch[5] == 0
+
+def test_sentiment_backfill_and_mismatches(client):
+    """
+    Test the sentiment backfill job, per-item sentiment averages and mismatch detection.
+    """
+    from services.reviews.reviews import score_review_sentiments
+    with app.app_context():
+        db.session.add(Review(customer_id=1, item_id=1, rating=5, comment="Terrible, it broke and I want a refund."))
+        db.session.add(Review(customer_id=2, item_id=1, rating=5, comment="Excellent, love it."))
+        db.session.commit()
+    client.post('/reviews/moderate_batch', json={"action": "approve", "review_ids": [1, 2]})
+    assert client.get('/reviews/summary/Laptop').get_json()["sentiment_average"] is None
+
+    with app.app_context():
+        assert score_review_sentiments(batch_size=1) == 2
+        assert score_review_sentiments() == 0
+        scores = [r.sentiment for r in Review.query.order_by(Review.id)]
+    summary = client.get('/reviews/summary/Laptop').get_json()
+    assert summary["count"] == 2
+    assert summary["sentiment_average"] == round(sum(scores) / 2, 3)
+
+    mismatched = client.get('/reviews/mismatched?item=Laptop').get_json()
+    assert [r["id"] for r in mismatched] == [1]
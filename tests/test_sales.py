@@ -1,3 +1,4 @@
+import re
 import pytest
 from app import app
 from database.database import db, Customer, InventoryItem
@@ -174,6 +175,25 @@ def test_get_purchase_history(client):
     assert history[0]["quantity"] == 1
     assert history[1]["item_name"] == "Headphones"
     assert history[1]["quantity"] == 2
+    assert re.fullmatch(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d", history[0]["timestamp"])
+
+def test_get_purchase_history_query_count(client):
+    """
+    Test that the purchase history runs as many queries for two purchases as for one.
+    """
+    client.post('/customers/charge/johndoe', json={"amount": 2000})
+    app.config['DB_QUERY_HEADERS'] = True
+    try:
+        counts = []
+        for item_name in ("Laptop", "Headphones"):
+            client.post('/sales/purchase', json={"username": "johndoe", "item_name": item_name, "quantity": 1})
+            response = client.get('/sales/purchase_history/johndoe')
+            assert len(response.get_json()) == len(counts) + 1
+            assert response.headers['Server-Timing'].startswith('db;dur=')
+            counts.append(int(response.headers['X-DB-Queries']))
+    finally:
+        app.config.pop('DB_QUERY_HEADERS')
+    assert counts[0] == counts[1]
 
 def test_get_purchase_history_no_purchases(client):
     """